@@ -0,0 +1,49 @@
+using Godot;
+
+namespace Zeffyr.Components.Map
+{
+    /// <summary>
+    /// Compact map tree written by tools/import_map_tree.py --compact.
+    /// Nodes are stored depth-first; the edges of node i are
+    /// [EdgeOffsets[i], EdgeOffsets[i + 1]) in the edge arrays.
+    /// </summary>
+    public class MapGraph : Resource
+    {
+        public const int ConditionCount = 7;
+
+        [Export]
+        public string[] Names = new string[0];
+
+        [Export]
+        public Vector3[] Positions = new Vector3[0];
+
+        [Export]
+        public float[] Sizes = new float[0];
+
+        /// <summary>Bit 0: warp gate, bit 1: lesser gate.</summary>
+        [Export]
+        public int[] Flags = new int[0];
+
+        /// <summary>
+        /// ConditionCount counters per node: big cubes, chests, locked doors,
+        /// other, secrets, small cubes, unlocked doors.
+        /// </summary>
+        [Export]
+        public int[] Conditions = new int[0];
+
+        [Export]
+        public int[] EdgeOffsets = new int[0];
+
+        [Export]
+        public int[] EdgeTargets = new int[0];
+
+        /// <summary>Left, Down, Back, Right, Top, Front.</summary>
+        [Export]
+        public int[] EdgeFaces = new int[0];
+
+        [Export]
+        public float[] EdgeBranches = new float[0];
+
+        public int NodeCount => Names.Length;
+    }
+}
@@ -0,0 +1,170 @@
+import io
+import glob
+import json
+import time
+import hashlib
+import multiprocessing as mp
+from pathlib import Path
+from functools import partial
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List, Optional, Tuple
+from profiling import Profiler, write_report
+
+# Incremental, parallel batch runs for the converters in tools/.
+#
+# A converter is a picklable `convert(source, profiler)` callable. run_batch
+# skips the sources whose build manifest entry (or output, see `current`) is
+# current, converts the rest across a process pool and prints one line per
+# source plus a summary. The exit code is 1 if any source failed.
+
+
+def file_hash(path: Path) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def collect_inputs(patterns: List[str]) -> List[Path]:
+    paths: List[Path] = []
+
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            paths += sorted(path.glob('*.xml'))
+        elif path.is_file():
+            paths += [path]
+        else:
+            paths += sorted(Path(p) for p in glob.glob(pattern))
+
+    # Overlapping patterns must not hand the same file to two workers
+    return list(dict.fromkeys(path.resolve() for path in paths))
+
+
+class BuildManifest:
+    """
+    Records which inputs every output was built from, keyed by the output
+    path, so batch runs can skip the sources that are unchanged. Subclasses
+    add the inputs besides the source XML to `inputs`.
+    """
+
+    def __init__(self, path: Path, version: int, suffix: str = '.tscn') -> None:
+        self.path = path
+        self.version = version
+        self.suffix = suffix
+        self.hashes: Dict[Path, str] = {}
+        try:
+            with open(path, 'rt') as file:
+                self.entries: Dict[str, Dict] = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def file_hash(self, path: Path) -> str:
+        if path not in self.hashes:
+            self.hashes[path] = file_hash(path)
+        return self.hashes[path]
+
+    def inputs(self, source: Path) -> Dict:
+        return {'xml': self.file_hash(source), 'version': self.version}
+
+    def is_current(self, source: Path, inputs: Dict) -> bool:
+        output = source.with_suffix(self.suffix)
+        return output.exists() and self.entries.get(str(output)) == inputs
+
+    def update(self, source: Path, inputs: Optional[Dict]) -> None:
+        output = str(source.with_suffix(self.suffix))
+        if inputs:
+            self.entries[output] = inputs
+        else:
+            self.entries.pop(output, None)
+
+    def save(self) -> None:
+        temp = self.path.with_suffix('.tmp')
+        with open(temp, 'wt') as file:
+            json.dump(self.entries, file, indent=4, sort_keys=True)
+        temp.replace(self.path)
+
+
+def convert_one(source: Path, convert: Callable, profile: Optional[str] = None,
+                cprofile: bool = False, quiet: bool = False) -> Tuple[Path, float, Optional[str], Dict]:
+    start = time.perf_counter()
+    profiler = Profiler(profile is not None, cprofile)
+    error = None
+    try:
+        if quiet:
+            with redirect_stdout(io.StringIO()):
+                convert(source, profiler)
+        else:
+            convert(source, profiler)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    if profile is not None:
+        profiler.dump_stats(Path(profile).with_suffix(f'.{source.stem}.prof'))
+    return (source, time.perf_counter() - start, error, profiler.phases)
+
+
+def run_batch(sources: List[Path], convert: Callable, tool: str, kind: str, tag: str,
+              jobs: Optional[int] = None, manifest: Optional[BuildManifest] = None,
+              profile: Optional[str] = None, cprofile: bool = False,
+              quiet: bool = False, current: Optional[Callable[[Path], bool]] = None) -> int:
+    """
+    Converts `sources` with `convert` across `jobs` worker processes. `kind`
+    names the sources in the summary and the report ('levels'), `tag` prefixes
+    the line of every converted source ('Level'). `quiet` drops the log of
+    the converter itself. Without a manifest, `current(source)` may tell
+    which sources are up to date.
+    """
+    failed: List[Tuple[Path, str]] = []
+    report: Dict[str, Dict] = {}
+    start = time.perf_counter()
+    worker = partial(convert_one, convert=convert, profile=profile,
+                     cprofile=cprofile, quiet=quiet)
+
+    inputs: Dict[Path, Optional[Dict]] = {}
+    if manifest:
+        for source in sources:
+            try:
+                inputs[source] = manifest.inputs(source)
+            except Exception:
+                # Unreadable inputs are rebuilt, the conversion reports why
+                inputs[source] = None
+        stale = [source for source in sources
+                 if not (inputs[source] and manifest.is_current(source, inputs[source]))]
+    elif current:
+        stale = [source for source in sources if not current(source)]
+    else:
+        stale = sources
+
+    rebuilt = set(stale)
+    for source in sources:
+        if source not in rebuilt:
+            print(f"[Skip] {source.name} (up to date)")
+
+    jobs = min(jobs or mp.cpu_count(), max(len(stale), 1))
+    with mp.Pool(jobs) as pool:
+        for source, elapsed, error, phases in pool.imap_unordered(worker, stale, chunksize=1):
+            report[str(source)] = {'seconds': round(elapsed, 4), 'phases': phases}
+            if error:
+                failed += [(source, error)]
+                print(f"[Failed] {source.name} ({elapsed:.2f}s): {error}")
+            else:
+                print(f"[{tag}] {source.name} ({elapsed:.2f}s)")
+            if manifest:
+                manifest.update(source, None if error else inputs[source])
+
+    if manifest:
+        manifest.save()
+    if profile is not None:
+        write_report(profile, tool, jobs=jobs,
+                     total_seconds=round(time.perf_counter() - start, 4), **{kind: report})
+
+    print("*" * 40)
+    print(f"[Done] {len(stale) - len(failed)}/{len(stale)} {kind} rebuilt, "
+          f"{len(sources) - len(stale)} up to date "
+          f"in {time.perf_counter() - start:.2f}s using {jobs} workers")
+    for source, error in failed:
+        print(f"[Failed] {source}: {error}")
+
+    return 1 if failed else 0
@@ -1,56 +1,31 @@
 import os, bpy, sys
-import xml.etree.ElementTree as etree
 
-def rotate(v):
-    import math
-    import mathutils
-    
-    eul = mathutils.Euler((math.radians(90.0), 0.0, 0.0), 'XYZ')
-    vec = mathutils.Vector(v)
-    vec.rotate(eul)
-    return vec[:]
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from xna_geometry import load_geometry
+from blend_utils import build_mesh, set_uvs, run_inputs, weld_geometry
 
-def parse(xml_path):
+def parse(xml_path, weld=False):
     art_dict = {}
     name = ""
 
-    with open(xml_path, 'rt') as file:
-        root = etree.fromstring(file.read())
-        
-
-        name = root.attrib['name'].lower()
-        normals, uvs, verts, idx = [], [], [], []
+    # Parsed from the XML once, then read from its .geometry.npz sidecar
+    cache = load_geometry(xml_path)
+    name = cache.name.lower()
+    geometry = cache[0]
 
-        size = root.find('Size/Vector3')
-        art_size = [( float(size.attrib["x"]), float(size.attrib["y"]), float(size.attrib["z"]) )]
+    if not geometry:
+        raise Exception("Looks like we're dealing with a ghost!")
+    else:
+        print(f"[Reading] {name} - verts:{len(geometry.vertices)}, faces:{len(geometry.faces)}, uv:{len(geometry.texcoords)}")
+        if weld:
+            geometry = weld_geometry(name, geometry)
         
-        for vertex in root.findall("ShaderInstancedIndexedPrimitives/Vertices/VertexPositionNormalTextureInstance"):
-            pos = vertex.find("Position/Vector3")
-            uv = vertex.find("TextureCoord/Vector2")
-            normal = vertex.find("Normal").text
-
-            og_pos = ( float(pos.attrib["x"]), float(pos.attrib["y"]), float(pos.attrib["z"]) )
-            verts += [rotate(og_pos)]
-
-            uvs += [( float(uv.attrib["x"]), float(uv.attrib["y"]) )]
-
-        indices = root.findall("ShaderInstancedIndexedPrimitives/Indices/Index")
-        for i in range(0, len(indices), 3):
-            face = (int(indices[i].text), int(indices[i+1].text), int(indices[i+2].text)) 
-            idx += [face]
-
-        if not (idx or verts or normals):
-            raise Exception("Looks like we're dealing with a ghost!")
-        else:
-            idx.reverse()
-            print(f"[Reading] {name} - verts:{len(verts)}, faces:{len(idx)}, uv:{len(uvs)}")
-            
-            art_dict = {
-                "name": name,
-                "vertex": verts,
-                "uv": uvs,
-                "indices": idx
-            }   
+        art_dict = {
+            "name": name,
+            "vertex": geometry.vertices,
+            "uv": geometry.texcoords,
+            "indices": geometry.faces
+        }   
     return name, art_dict
 
 def create_material(image_path, mat_name):
@@ -73,16 +48,9 @@ def create_material(image_path, mat_name):
 
 def convert(art, mat_name):
     name = art['name'].lower().replace(' ', '_')
-    mesh = bpy.data.meshes.new(name)
-    mesh.from_pydata(art['vertex'], [], art['indices'])
-        
-    uv_layer = mesh.uv_layers.new()
-    mesh.uv_layers.active = uv_layer
+    mesh = build_mesh(name, art['vertex'], art['indices'])
         
-    for face in mesh.polygons:
-        for vi, li in zip(face.vertices, face.loop_indices):
-            uv_layer.data[li].uv[0] = art['uv'][vi][0]
-            uv_layer.data[li].uv[1] = 1.0 - art['uv'][vi][1]
+    set_uvs(mesh, art['uv'])
         
     mesh.update()
     mesh.validate()
@@ -102,22 +70,23 @@ def convert(art, mat_name):
     scene.collection.objects.link(obj)
     print(f"[Processing] -> {art['name']}")
         
-if __name__ == '__main__': 
-    argv = sys.argv
-    argv = argv[argv.index("--") + 1:]
-    bpy.ops.wm.read_homefile(use_empty=True)
-    
-    filename = os.path.splitext(argv[0])[0]
+def import_art(path, weld=False):
+    filename = os.path.splitext(path)[0]
     abs_path = os.path.dirname(os.path.abspath(__file__))
     
     xml_path = os.path.join(abs_path, filename+'.xml')
     png_path = os.path.join(abs_path, filename+'.png')
     
-    name, data = parse(xml_path)
+    name, data = parse(xml_path, weld)
     create_material(png_path, name)
     convert(data, name)
     
     bpy.ops.wm.save_as_mainfile(filepath=filename+'.blend')
     bpy.ops.export_scene.gltf(export_format='GLTF_EMBEDDED', 
                               export_copyright='Copyright © Zerocker 2020',
-                              filepath=filename)
\ No newline at end of file
+                              filepath=filename)
+
+if __name__ == '__main__': 
+    argv = sys.argv
+    argv = argv[argv.index("--") + 1:]
+    run_inputs(argv, import_art)
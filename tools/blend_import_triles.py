@@ -1,66 +1,42 @@
 import bpy
 import sys
-import xml.etree.ElementTree as etree
+import argparse
+import numpy as np
 from dataclasses import dataclass
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parent))
+from xna_geometry import load_geometry
+from blend_utils import build_mesh, set_uvs, weld_geometry
+
 
 @dataclass
 class Trile:
     name: str
-    vertices: list
-    texcoords: list
-    indices: list
-
-
-def rotate_mesh(v):
-    import math
-    import mathutils
-
-    eul = mathutils.Euler((math.radians(90.0), 0.0, 0.0), 'XYZ')
-    vec = mathutils.Vector(v)
-    vec.rotate(eul)
-    return vec[:]
+    vertices: np.ndarray
+    texcoords: np.ndarray
+    indices: np.ndarray
 
 
-def parse_xml(xml_path):
+def parse_xml(xml_path, weld=False):
     triles = []
 
-    with open(xml_path, 'rt') as file:
-        root = etree.fromstring(file.read())
-        set_name = root.attrib['name'].lower()
-
-        for entry in root.iter('TrileEntry'):
-            name, uvs, verts, idx = "", [], [], []
-
-            for trile in entry.iter("Trile"):
-                name = trile.attrib["name"]
-
-                for vertex in trile.findall("Geometry/ShaderInstancedIndexedPrimitives/Vertices/VertexPositionNormalTextureInstance"):
-                    pos = vertex.find("Position/Vector3")
-                    uv = vertex.find("TextureCoord/Vector2")
-
-                    og_pos = (float(pos.attrib["x"]), float(
-                        pos.attrib["y"]), float(pos.attrib["z"]))
-                    verts += [rotate_mesh(og_pos)]
+    # Parsed from the XML once, then read from its .geometry.npz sidecar
+    cache = load_geometry(xml_path)
+    set_name = cache.name.lower()
 
-                    uvs += [(float(uv.attrib["x"]), float(uv.attrib["y"]))]
+    for i, name in enumerate(cache.names):
+        geometry = cache[i]
 
-                indices = trile.findall(
-                    "Geometry/ShaderInstancedIndexedPrimitives/Indices/Index")
-                for i in range(0, len(indices), 3):
-                    face = (int(indices[i].text), int(
-                        indices[i+1].text), int(indices[i+2].text))
-                    idx += [face]
+        if not geometry:
+            continue
+        else:
+            print(
+                f"[Reading] {name} - verts:{len(geometry.vertices)}, faces:{len(geometry.faces)}, uv:{len(geometry.texcoords)}")
+            if weld:
+                geometry = weld_geometry(name, geometry)
 
-            if not (idx or verts):
-                continue
-            else:
-                idx.reverse()
-                print(
-                    f"[Reading] {name} - verts:{len(verts)}, faces:{len(idx)}, uv:{len(uvs)}")
-
-            triles += [Trile(name, verts, uvs, idx)]
+        triles += [Trile(name, geometry.vertices, geometry.texcoords, geometry.faces)]
 
     print("*" * 40)
     return set_name, triles
@@ -86,19 +62,11 @@ def create_material(mat_name: str, path: Path):
     #links.new(shader.outputs['Background'], out.inputs['Surface'])
 
 
-def convert_to_blend(trile: Trile, mat_name: str, path: Path):
-    trile: Trile
+def convert_to_blend(trile: Trile, mat_name: str):
     name = trile.name.lower().replace(' ', '_')
-    mesh = bpy.data.meshes.new(name)
-    mesh.from_pydata(trile.vertices, [], trile.indices)
+    mesh = build_mesh(name, trile.vertices, trile.indices)
 
-    uv_layer = mesh.uv_layers.new()
-    mesh.uv_layers.active = uv_layer
-
-    for face in mesh.polygons:
-        for vi, li in zip(face.vertices, face.loop_indices):
-            uv_layer.data[li].uv[0] = trile.texcoords[vi][0]
-            uv_layer.data[li].uv[1] = 1.0 - trile.texcoords[vi][1]
+    set_uvs(mesh, trile.texcoords)
 
     mesh.update()
     mesh.validate()
@@ -113,36 +81,66 @@ def convert_to_blend(trile: Trile, mat_name: str, path: Path):
 
     scene = bpy.context.scene
     scene.collection.objects.link(obj)
+    return name, obj
+
 
+def export_trile(obj, name: str, path: Path, save_blend: bool, single_session: bool):
     blend_path = path / f"{name}.blend"
     gltf_path = path / f"{name}.gltf"
 
     # Save as blend
-    bpy.ops.wm.save_as_mainfile(filepath=str(blend_path))
+    if save_blend and single_session:
+        # The session holds every trile exported so far, only write this one
+        # (and the mesh, material and image it uses)
+        bpy.data.libraries.write(str(blend_path), {obj}, fake_user=True)
+    elif save_blend:
+        bpy.ops.wm.save_as_mainfile(filepath=str(blend_path))
+
+    # Save as GLTF, only the selected trile
+    for other in bpy.context.scene.objects:
+        other.select_set(other == obj)
+    bpy.context.view_layer.objects.active = obj
 
-    # Save as GLTF
     bpy.ops.export_scene.gltf(
            export_format='GLTF_SEPARATE',
-           filepath=str(gltf_path))
+           filepath=str(gltf_path),
+           use_selection=True)
 
 
 if __name__ == '__main__':
     argv = sys.argv
     argv = argv[argv.index("--") + 1:]
 
-    xml_path = Path(argv[0]).resolve()
+    parser = argparse.ArgumentParser(prog="blend_import_triles.py")
+    parser.add_argument("xml", help="trile set XML (the PNG next to it is the texture)")
+    parser.add_argument("--single-session", action="store_true",
+                        help="keep one Blender session and material for the whole set "
+                             "instead of resetting it for every trile")
+    parser.add_argument("--no-blend", action="store_true",
+                        help="only export .gltf files, skip the per-trile .blend")
+    parser.add_argument("--weld", action="store_true",
+                        help="merge duplicate vertices before building meshes")
+    args = parser.parse_args(argv)
+
+    xml_path = Path(args.xml).resolve()
     png_path = xml_path.with_suffix('.png')
 
-    name, triles = parse_xml(xml_path)
+    name, triles = parse_xml(xml_path, args.weld)
     trile: Trile
 
     triles_path = xml_path.parent / name
     triles_path.mkdir(parents=True, exist_ok=True)
 
-    for i, trile in enumerate(triles):
+    if args.single_session:
         bpy.ops.wm.read_homefile(use_empty=True)
         create_material(name, png_path)
 
+    for i, trile in enumerate(triles):
+        if not args.single_session:
+            bpy.ops.wm.read_homefile(use_empty=True)
+            create_material(name, png_path)
+
         print(f"[Processing {i+1}/{len(triles)}] -> {trile.name}")
-        convert_to_blend(trile, name, triles_path)
-        print()
\ No newline at end of file
+        trile_name, obj = convert_to_blend(trile, name)
+        export_trile(obj, trile_name, triles_path, not args.no_blend, args.single_session)
+        print()
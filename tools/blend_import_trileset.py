@@ -1,61 +1,39 @@
 import os, bpy, sys, json
-import xml.etree.ElementTree as etree
 
-def rotate(v):
-    import math
-    import mathutils
-    
-    eul = mathutils.Euler((math.radians(90.0), 0.0, 0.0), 'XYZ')
-    vec = mathutils.Vector(v)
-    vec.rotate(eul)
-    return vec[:]
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from xna_geometry import load_geometry
+from blend_utils import build_mesh, set_uvs, run_inputs, weld_geometry
 
-def parse(xml_path):
+def parse(xml_path, weld=False):
     triles = []
     id_map = {}
 
-    with open(xml_path, 'rt') as file:
-        root = etree.fromstring(file.read())
-        set_name = root.attrib['name'].lower()
-        counter = 0
-
-        for entry in root.iter('TrileEntry'):
-            id = entry.attrib['key']
-            name, normals, uvs, verts, idx = "", [], [], [], []
-            
-            for trile in entry.iter("Trile"):
-                name = trile.attrib["name"]
-
-                for vertex in trile.findall("Geometry/ShaderInstancedIndexedPrimitives/Vertices/VertexPositionNormalTextureInstance"):
-                    pos = vertex.find("Position/Vector3")
-                    uv = vertex.find("TextureCoord/Vector2")
-
-                    og_pos = ( float(pos.attrib["x"]), float(pos.attrib["y"]), float(pos.attrib["z"]) )
-                    verts += [rotate(og_pos)]
-
-                    uvs += [( float(uv.attrib["x"]), float(uv.attrib["y"]) )]   
+    # Parsed from the XML once, then read from its .geometry.npz sidecar
+    cache = load_geometry(xml_path)
+    set_name = cache.name.lower()
+    counter = 0
 
-                indices = trile.findall("Geometry/ShaderInstancedIndexedPrimitives/Indices/Index")
-                for i in range(0, len(indices), 3):
-                    face = (int(indices[i].text), int(indices[i+1].text), int(indices[i+2].text)) 
-                    idx += [face]
+    for i, id in enumerate(cache.keys):
+        name = cache.names[i]
+        geometry = cache[i]
 
-            if not (idx or verts):
-                continue
-            else:
-                idx.reverse()
-                print(f"[Reading id={id}] {name} - verts:{len(verts)}, faces:{len(idx)}, uv:{len(uvs)}")
-            
-            trile_dict = {
-                "name": name,
-                "vertex": verts,
-                "uv": uvs,
-                "indices": idx 
-            }
-            triles += [trile_dict]
-            
-            id_map[id] = counter
-            counter += 1
+        if not geometry:
+            continue
+        else:
+            print(f"[Reading id={id}] {name} - verts:{len(geometry.vertices)}, faces:{len(geometry.faces)}, uv:{len(geometry.texcoords)}")
+            if weld:
+                geometry = weld_geometry(name, geometry)
+        
+        trile_dict = {
+            "name": name,
+            "vertex": geometry.vertices,
+            "uv": geometry.texcoords,
+            "indices": geometry.faces
+        }
+        triles += [trile_dict]
+        
+        id_map[id] = counter
+        counter += 1
   
     return set_name, triles, id_map
 
@@ -83,16 +61,9 @@ def convert(triles, mat_name):
     
     for i, trile in enumerate(triles):
         name = trile['name'].lower().replace(' ', '_')
-        mesh = bpy.data.meshes.new(name)
-        mesh.from_pydata(trile['vertex'], [], trile['indices'])
-        
-        uv_layer = mesh.uv_layers.new()
-        mesh.uv_layers.active = uv_layer
+        mesh = build_mesh(name, trile['vertex'], trile['indices'])
         
-        for face in mesh.polygons:
-            for vi, li in zip(face.vertices, face.loop_indices):
-                uv_layer.data[li].uv[0] = trile['uv'][vi][0]
-                uv_layer.data[li].uv[1] = 1.0 - trile['uv'][vi][1]
+        set_uvs(mesh, trile['uv'])
         
         mesh.update()
         mesh.validate()
@@ -118,19 +89,15 @@ def convert(triles, mat_name):
         if ((i+1) % 10 == 0):
             rows += 2
         
-if __name__ == '__main__': 
-    argv = sys.argv
-    argv = argv[argv.index("--") + 1:]
-    bpy.ops.wm.read_homefile(use_empty=True)
-    
-    filename = os.path.splitext(argv[0])[0]
+def import_trileset(path, weld=False):
+    filename = os.path.splitext(path)[0]
     abs_path = os.path.dirname(os.path.abspath(__file__))
     
     xml_path = os.path.join(abs_path, filename+'.xml')
     png_path = os.path.join(abs_path, filename+'.png')
     ids_path = os.path.join(abs_path, filename+'_ids.json')
     
-    name, data, ids = parse(xml_path)
+    name, data, ids = parse(xml_path, weld)
     create_material(png_path, name)   
     convert(data, name)
     
@@ -140,4 +107,8 @@ if __name__ == '__main__':
                               filepath=filename)
     with open(ids_path, 'wt') as fp:
         json.dump(ids, fp, indent=4)
-        
\ No newline at end of file
+
+if __name__ == '__main__': 
+    argv = sys.argv
+    argv = argv[argv.index("--") + 1:]
+    run_inputs(argv, import_trileset)
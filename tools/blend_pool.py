@@ -0,0 +1,119 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import List
+
+# Runs the blend_import_* scripts over many inputs with N headless Blender
+# processes. The inputs are sharded across the workers, and every worker
+# imports its whole shard in one Blender session (see run_inputs in
+# blend_utils), so a rebuild pays one Blender startup per worker instead of
+# one per file.
+#
+#   python blend_pool.py arts "Art Objects/*.xml" -j 8
+#   python blend_pool.py trileset "Trile Sets/*.xml" --blender /opt/blender/blender
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = {
+    'arts': 'blend_import_arts.py',
+    'trileset': 'blend_import_trileset.py',
+}
+
+
+def collect_inputs(patterns: List[str]) -> List[str]:
+    inputs = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        # Absolute, the scripts resolve relative inputs against tools/
+        inputs += [os.path.abspath(path) for path in matches
+                   if os.path.abspath(path) not in inputs]
+    return inputs
+
+
+def shard(inputs: List[str], jobs: int) -> List[List[str]]:
+    # Biggest files first, dealt round robin, so the shards end up with
+    # roughly the same amount of geometry to import
+    def size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    shards = [[] for _ in range(min(jobs, len(inputs)))]
+    for i, path in enumerate(sorted(inputs, key=size, reverse=True)):
+        shards[i % len(shards)] += [path]
+    return shards
+
+
+def run_pool(blender: str, script: str, inputs: List[str], jobs: int, weld: bool = False) -> int:
+    shards = shard(inputs, jobs)
+    print(f"[Pool] {len(inputs)} input(s) across {len(shards)} Blender worker(s)")
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="blend_pool_") as tmp:
+        workers = []
+        for i, paths in enumerate(shards):
+            list_path = Path(tmp) / f"worker{i}.txt"
+            results_path = Path(tmp) / f"worker{i}.json"
+            log_path = Path(tmp) / f"worker{i}.log"
+            list_path.write_text('\n'.join(paths), encoding='utf-8')
+
+            log = open(log_path, 'wt')
+            command = [blender, "--background", "--python", os.path.join(TOOLS, script), "--",
+                       "--list", str(list_path), "--results", str(results_path)]
+            if weld:
+                command += ["--weld"]
+            workers += [(paths, results_path, log_path, log,
+                         subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT))]
+
+        results, failed = [], []
+        for paths, results_path, log_path, log, process in workers:
+            process.wait()
+            log.close()
+
+            if results_path.exists():
+                with open(results_path, 'rt', encoding='utf-8') as file:
+                    results += json.load(file)
+                continue
+
+            # The worker died before writing its results, blame its whole shard
+            print(f"[Worker] exited with {process.returncode}, last output:")
+            print(''.join(log_path.read_text(errors='replace').splitlines(True)[-20:]))
+            results += [{'input': path, 'seconds': None, 'error': "worker crashed"}
+                        for path in paths]
+
+    for result in results:
+        if result['error']:
+            failed += [result]
+            print(f"[Failed] {result['input']}: {result['error']}")
+        else:
+            print(f"[Done] {result['input']} ({result['seconds']:.2f}s)")
+
+    print(f"[Pool] {len(results) - len(failed)} done, {len(failed)} failed "
+          f"in {time.perf_counter() - start:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a blend_import_* script over many inputs in parallel")
+    parser.add_argument("kind", choices=sorted(SCRIPTS), help="which importer to run")
+    parser.add_argument("inputs", nargs="+", help="input XML files or glob patterns")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of Blender processes (default: CPU count)")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"),
+                        help="Blender executable (default: $BLENDER or `blender`)")
+    parser.add_argument("--weld", action="store_true",
+                        help="merge duplicate vertices before building meshes")
+    args = parser.parse_args()
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("No inputs ...")
+        sys.exit(-1)
+
+    sys.exit(run_pool(args.blender, SCRIPTS[args.kind], inputs, max(1, args.jobs), args.weld))
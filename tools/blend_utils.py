@@ -0,0 +1,109 @@
+import bpy
+import json
+import time
+import argparse
+import traceback
+import numpy as np
+
+from xna_geometry import Geometry, weld
+
+# Blender helpers shared by the blend_import_* scripts. Meshes are filled in
+# bulk with foreach_set from the arrays in xna_geometry instead of going
+# through from_pydata's per-element Python lists.
+
+
+def build_mesh(name: str, vertices: np.ndarray, faces: np.ndarray):
+    mesh = bpy.data.meshes.new(name)
+    loops = np.ascontiguousarray(faces, dtype=np.int32).ravel()
+
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(vertices, dtype=np.float32).ravel())
+
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set("vertex_index", loops)
+
+    mesh.polygons.add(len(faces))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, len(loops), 3, dtype=np.int32))
+    # Newer Blenders derive loop_total from the loop starts and make it read-only
+    if not mesh.polygons.bl_rna.properties["loop_total"].is_readonly:
+        mesh.polygons.foreach_set("loop_total", np.full(len(faces), 3, dtype=np.int32))
+
+    # The edges and the loops' edge indices, instead of leaving them to validate()
+    mesh.update(calc_edges=True)
+    return mesh
+
+
+def set_uvs(mesh, texcoords: np.ndarray):
+    # One gather from the per-vertex UVs to the per-loop UVs, V flipped
+    loops = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+
+    uvs = np.asarray(texcoords, dtype=np.float32)[loops]
+    uvs[:, 1] = 1.0 - uvs[:, 1]
+
+    uv_layer = mesh.uv_layers.new()
+    mesh.uv_layers.active = uv_layer
+    uv_layer.data.foreach_set("uv", uvs.ravel())
+    return uv_layer
+
+
+def weld_geometry(name: str, geometry: Geometry) -> Geometry:
+    # Blender computes its own normals, so only position and UV are compared
+    welded = weld(geometry)
+    print(f"[Weld] {name} - verts:{len(geometry.vertices)} -> {len(welded.vertices)}")
+    return welded
+
+
+def reset_scene():
+    # Drop what the previous import created instead of a read_homefile per
+    # input, the session (and its loaded add-ons) stays up
+    for blocks in (bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.images):
+        for block in list(blocks):
+            blocks.remove(block)
+
+
+def run_inputs(argv, import_one):
+    """
+    Runs `import_one(path, weld)` for every input given after `--`, either on the
+    command line or in a --list file (one path per line, see blend_pool.py).
+    A failing input is reported and skipped. With --results a JSON list of
+    {input, seconds, error} is written for the driver to gather.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", nargs="*")
+    parser.add_argument("--list", help="file with one input path per line")
+    parser.add_argument("--results", help="write per-input results to this JSON file")
+    parser.add_argument("--weld", action="store_true", help="merge duplicate vertices before building meshes")
+    args = parser.parse_args(argv)
+
+    inputs = list(args.inputs)
+    if args.list:
+        with open(args.list, 'rt', encoding='utf-8') as file:
+            inputs += [line.strip() for line in file if line.strip()]
+
+    bpy.ops.wm.read_homefile(use_empty=True)
+    results = []
+
+    for i, path in enumerate(inputs):
+        if i:
+            reset_scene()
+
+        start = time.perf_counter()
+        try:
+            import_one(path, args.weld)
+            error = None
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+            print(f"[Failed] {path}: {error}")
+
+        results += [{
+            'input': path,
+            'seconds': round(time.perf_counter() - start, 3),
+            'error': error
+        }]
+
+    if args.results:
+        with open(args.results, 'wt', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+    return results
@@ -0,0 +1,37 @@
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+
+from xna_geometry import GeometryCache
+from profiling import Profiler, add_arguments
+from batching import collect_inputs, run_batch
+
+# Builds the .geometry.npz sidecars of trile set and art object XMLs ahead of
+# the Blender imports, in plain CPython and in parallel. Sidecars that are
+# already current are skipped unless --force is given.
+#
+#   python cache_geometry.py "Trile Sets/*.xml" "Art Objects/*.xml" -j 8
+
+
+def cache_file(path: Path, profiler: Profiler) -> None:
+    with profiler.phase('read'):
+        cache = GeometryCache.from_xml(path)
+    with profiler.phase('write'):
+        cache.write_sidecar(path)
+
+
+if __name__ == '__main__':
+    mp.freeze_support()
+
+    parser = argparse.ArgumentParser(description="Cache XNA geometry XMLs as .geometry.npz sidecars")
+    parser.add_argument("inputs", nargs="+", help="trile set / art object XMLs, directories or glob patterns")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="rebuild current sidecars too")
+    add_arguments(parser, 'cache_geometry')
+    args = parser.parse_args()
+
+    paths = collect_inputs(args.inputs)
+    current = None if args.force else GeometryCache.sidecar_is_current
+    exit(run_batch(paths, cache_file, 'cache_geometry', 'sidecars', 'Cached', args.jobs,
+                   profile=args.profile, cprofile=args.cprofile, current=current))
@@ -0,0 +1,153 @@
+import json
+import argparse
+import multiprocessing as mp
+from functools import partial
+from pathlib import Path
+from typing import Dict
+
+from xna_geometry import Geometry, load_geometry, weld
+from gltf_writer import GltfWriter
+from profiling import Profiler, add_arguments
+from batching import collect_inputs, run_batch
+
+# Writes the same glTFs as the blend_import_* scripts straight from the parsed
+# geometry, without Blender:
+#
+#   arts      <art>.gltf (embedded), one textured mesh
+#   trileset  <set>.gltf (embedded) with the triles laid out in a 10 column
+#             grid, plus <set>_ids.json mapping trile ids to mesh indices
+#   triles    <set>/<trile>.gltf (+ .bin and texture) for every trile
+#
+#   python export_gltf.py arts "Art Objects/*.xml" -j 8
+#
+# --weld merges duplicate vertices (same position, UV and normal) first and
+# reports the vertex counts before and after.
+
+COPYRIGHT = 'Copyright © Zerocker 2020'
+
+
+def mesh_name(name: str) -> str:
+    return name.lower().replace(' ', '_')
+
+
+def prepare(geometry: Geometry, welding: bool, stats: Dict) -> Geometry:
+    stats['meshes'] += 1
+    stats['vertices'] += len(geometry.vertices)
+    if welding:
+        geometry = weld(geometry, normals=True)
+    stats['welded'] += len(geometry.vertices)
+    return geometry
+
+
+def new_stats() -> Dict:
+    return {'meshes': 0, 'vertices': 0, 'welded': 0}
+
+
+def export_art(xml_path: Path, welding: bool = False, profiler: Profiler = Profiler()) -> Dict:
+    with profiler.phase('read'):
+        cache = load_geometry(xml_path)
+    name = cache.name.lower()
+    geometry = cache[0]
+    stats = new_stats()
+
+    if not geometry:
+        raise Exception("Looks like we're dealing with a ghost!")
+
+    geometry = prepare(geometry, welding, stats)
+    gltf = GltfWriter(COPYRIGHT)
+    material = gltf.add_texture_material(name, xml_path.with_suffix('.png'))
+    gltf.add_node(name, gltf.add_mesh(mesh_name(name), geometry, material))
+    with profiler.phase('write'):
+        gltf.write(xml_path.with_suffix('.gltf'))
+    return stats
+
+
+def export_trileset(xml_path: Path, welding: bool = False, profiler: Profiler = Profiler()) -> Dict:
+    with profiler.phase('read'):
+        cache = load_geometry(xml_path)
+    name = cache.name.lower()
+    stats = new_stats()
+
+    gltf = GltfWriter(COPYRIGHT)
+    material = gltf.add_texture_material(name, xml_path.with_suffix('.png'))
+    ids = {}
+    cols = 0
+    rows = 0
+
+    for i, key in enumerate(cache.keys):
+        geometry = cache[i]
+        if not geometry:
+            continue
+
+        # Blender lays the triles out at (cols, rows, 0), that is (cols, 0, -rows) in Y-up
+        geometry = prepare(geometry, welding, stats)
+        mesh = gltf.add_mesh(mesh_name(cache.names[i]), geometry, material)
+        gltf.add_node(cache.names[i], mesh, (cols, 0, -rows))
+        ids[key] = len(ids)
+
+        cols -= 2
+        cols %= 20
+        if (len(ids) % 10 == 0):
+            rows += 2
+
+    with profiler.phase('write'):
+        gltf.write(xml_path.with_suffix('.gltf'))
+        with open(xml_path.with_name(xml_path.stem + '_ids.json'), 'wt') as fp:
+            json.dump(ids, fp, indent=4)
+    return stats
+
+
+def export_triles(xml_path: Path, welding: bool = False, profiler: Profiler = Profiler()) -> Dict:
+    with profiler.phase('read'):
+        cache = load_geometry(xml_path)
+    name = cache.name.lower()
+    png_path = xml_path.with_suffix('.png')
+    stats = new_stats()
+
+    triles_path = xml_path.parent / name
+    triles_path.mkdir(parents=True, exist_ok=True)
+
+    for i, trile_name in enumerate(cache.names):
+        geometry = cache[i]
+        if not geometry:
+            continue
+
+        geometry = prepare(geometry, welding, stats)
+        gltf = GltfWriter()
+        material = gltf.add_texture_material(name, png_path)
+        gltf.add_node(trile_name, gltf.add_mesh(mesh_name(trile_name), geometry, material))
+        with profiler.phase('write'):
+            gltf.write(triles_path / f"{mesh_name(trile_name)}.gltf", embed=False)
+    return stats
+
+
+EXPORTERS = {
+    'arts': export_art,
+    'trileset': export_trileset,
+    'triles': export_triles,
+}
+
+
+def export_file(path: Path, profiler: Profiler, kind: str, welding: bool) -> None:
+    stats = EXPORTERS[kind](path, welding, profiler)
+    welded = f" -> {stats['welded']}" if welding else ""
+    print(f"[glTF] {path} - meshes:{stats['meshes']}, verts:{stats['vertices']}{welded}")
+
+
+if __name__ == '__main__':
+    mp.freeze_support()
+
+    parser = argparse.ArgumentParser(description="Export trile sets and art objects to glTF without Blender")
+    parser.add_argument("kind", choices=sorted(EXPORTERS), help="what to export")
+    parser.add_argument("inputs", nargs="+", help="input XMLs, directories or glob patterns")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--weld", action="store_true",
+                        help="merge duplicate vertices and use the smallest index type")
+    add_arguments(parser, 'export_gltf')
+    args = parser.parse_args()
+
+    paths = collect_inputs(args.inputs)
+    export = partial(export_file, kind=args.kind, welding=args.weld)
+    exit(run_batch(paths, export, 'export_gltf', 'files', 'Exported', args.jobs,
+                   profile=args.profile, cprofile=args.cprofile))
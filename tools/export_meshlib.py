@@ -0,0 +1,121 @@
+import sys
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+
+from godot_parser import GDObject
+from xna_geometry import Geometry, load_geometry, weld
+from gltf_writer import to_gltf_space
+from tscn_writer import TscnWriter, PoolByteArray
+
+# Writes a trileset straight to a Godot 3 MeshLibrary (.tres), instead of
+# going through the glTF -> imported scene -> "Convert to MeshLibrary" route.
+#
+# Item ids are the positions of the triles in the trileset XML, the same ids
+# import_level2.py writes into the GridMap cells (TrilesetIndex), so the
+# library needs no remapping. Every trile with geometry gets its own ArrayMesh
+# with a precomputed AABB; collision-only triles keep their id but no mesh.
+#
+#   python export_meshlib.py "Trile Sets/untitled.xml"
+#   -> Trile Sets/untitled.tres, for res://assets/Trilesets/untitled.tres
+
+# Uncompressed surfaces: float3 position, [float3 normal], float2 UV, indexed
+ARRAY_FORMAT_VERTEX = 1
+ARRAY_FORMAT_NORMAL = 2
+ARRAY_FORMAT_TEX_UV = 16
+ARRAY_FORMAT_INDEX = 256
+PRIMITIVE_TRIANGLES = 4
+
+
+def aabb(positions: np.ndarray) -> GDObject:
+    low, high = positions.min(axis=0), positions.max(axis=0)
+    return GDObject("AABB", *[round(float(v), 6) for v in (*low, *(high - low))])
+
+
+def make_surface(geometry: Geometry, material) -> dict:
+    positions, normals, texcoords = to_gltf_space(geometry)
+
+    format = ARRAY_FORMAT_VERTEX | ARRAY_FORMAT_TEX_UV | ARRAY_FORMAT_INDEX
+    columns = [positions]
+    lengths = np.linalg.norm(normals, axis=1)
+    if np.all(np.abs(lengths - 1.0) < 1e-3):
+        format |= ARRAY_FORMAT_NORMAL
+        columns += [normals]
+    columns += [texcoords]
+
+    # Vertex attributes are interleaved, in ARRAY_* order
+    vertices = np.ascontiguousarray(np.hstack(columns), dtype='<f4')
+
+    # Godot's front faces are clockwise, its glTF importer swaps the first
+    # and last index of every triangle too
+    faces = geometry.faces[:, ::-1]
+    indices = np.ascontiguousarray(faces.ravel(), dtype='<u4' if len(vertices) >= 1 << 16 else '<u2')
+
+    return {
+        "aabb": aabb(positions),
+        "array_data": PoolByteArray(vertices.tobytes()),
+        "array_index_data": PoolByteArray(indices.tobytes()),
+        "blend_shape_data": [],
+        "format": format,
+        "index_count": len(indices),
+        "material": material,
+        "primitive": PRIMITIVE_TRIANGLES,
+        "skeleton_aabb": [],
+        "vertex_count": len(vertices),
+    }
+
+
+def export_meshlib(xml_path: Path, material_path: str, welding: bool = False) -> Path:
+    cache = load_geometry(xml_path)
+    scene = TscnWriter()
+    material = scene.add_ext_resource(material_path, "Material").reference
+    items = {}
+    vertices = welded = 0
+
+    for id, name in enumerate(cache.names):
+        geometry = cache[id]
+        items[f"item/{id}/name"] = name
+
+        if not geometry:
+            print(f"[Item {id}] {name} - collision only")
+            continue
+
+        vertices += len(geometry.vertices)
+        if welding:
+            geometry = weld(geometry, normals=True)
+        welded += len(geometry.vertices)
+
+        mesh = scene.add_sub_resource("ArrayMesh", **{
+            "resource_name": name,
+            "surfaces/0": make_surface(geometry, material),
+        })
+        items[f"item/{id}/mesh"] = mesh.reference
+        items[f"item/{id}/shapes"] = []
+        print(f"[Item {id}] {name} - verts:{len(geometry.vertices)}, faces:{len(geometry.faces)}")
+
+    tres_path = xml_path.with_suffix('.tres')
+    scene.write_resource(tres_path, "MeshLibrary", items)
+
+    counts = f"{vertices} -> {welded}" if welding else f"{vertices}"
+    print(f"[MeshLibrary] {tres_path} - items:{len(cache)}, verts:{counts}")
+    return tres_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a trileset XML as a Godot MeshLibrary")
+    parser.add_argument("path", help="trileset XML")
+    parser.add_argument("--material", default=None,
+                        help="material resource of the trileset "
+                             "(default: res://assets/Trilesets/<Name>/<name>.tres)")
+    parser.add_argument("--weld", action="store_true", help="merge duplicate vertices first")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    xml_path = Path(args.path).resolve()
+    name = load_geometry(xml_path).name
+    material = args.material or f"res://assets/Trilesets/{name.capitalize()}/{name.lower()}.tres"
+
+    export_meshlib(xml_path, material, args.weld)
+    print(f"[Done] {time.perf_counter() - start:.2f}s")
+    sys.exit(0)
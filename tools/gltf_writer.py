@@ -0,0 +1,201 @@
+import json
+import base64
+import shutil
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from xna_geometry import Geometry
+
+# Minimal glTF 2.0 writer for the trile and art object meshes, so they can be
+# exported without Blender (see export_gltf.py).
+#
+# The output matches what the blend_import_* scripts get out of Blender's
+# exporter: the importers rotate +90° around X into Blender's Z-up and flip V,
+# and the exporter converts back to Y-up (x, z, -y) and flips V again, so the
+# UVs are written as exported by XNA. Faces keep the reversed order and
+# winding of Geometry.faces. The texture is sampled nearest, like the
+# 'Closest' interpolation of the Blender material.
+
+FLOAT = 5126
+UNSIGNED_INT = 5125
+UNSIGNED_SHORT = 5123
+UNSIGNED_BYTE = 5121
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+NEAREST = 9728
+REPEAT = 10497
+
+# Blender Z-up -> glTF Y-up, as applied by Blender's exporter
+Z_UP_TO_Y_UP = np.array([
+    [1.0, 0.0, 0.0],
+    [0.0, 0.0, 1.0],
+    [0.0, -1.0, 0.0],
+], dtype=np.float32)
+
+
+def to_gltf_space(geometry: Geometry):
+    positions = geometry.vertices @ Z_UP_TO_Y_UP.T
+    normals = geometry.normals @ Z_UP_TO_Y_UP.T
+    return positions, normals, geometry.texcoords
+
+
+def copy_image(source: Path, target: Path) -> None:
+    # Every trile of a set shares the set texture, only copy it once
+    if target.resolve() == source.resolve():
+        return
+    if target.exists():
+        old, new = target.stat(), source.stat()
+        if old.st_size == new.st_size and old.st_mtime_ns == new.st_mtime_ns:
+            return
+    shutil.copy2(source, target)
+
+
+class GltfWriter:
+    def __init__(self, copyright: Optional[str] = None) -> None:
+        self.json: Dict = {
+            'asset': {'version': '2.0', 'generator': 'Zeffyr gltf_writer.py'},
+            'scene': 0,
+            'scenes': [{'nodes': []}],
+            'nodes': [],
+            'meshes': [],
+            'materials': [],
+            'textures': [],
+            'samplers': [],
+            'accessors': [],
+            'bufferViews': [],
+            'buffers': [],
+        }
+        if copyright:
+            self.json['asset']['copyright'] = copyright
+        self.images: List[Tuple[str, Path]] = []
+        self.chunks: List[bytes] = []
+        self.length = 0
+
+    def add_texture_material(self, name: str, image_path: Path) -> int:
+        if not self.json['samplers']:
+            self.json['samplers'] += [{
+                'magFilter': NEAREST, 'minFilter': NEAREST,
+                'wrapS': REPEAT, 'wrapT': REPEAT
+            }]
+
+        self.images += [(name, Path(image_path))]
+        self.json['textures'] += [{'sampler': 0, 'source': len(self.images) - 1}]
+        self.json['materials'] += [{
+            'name': name,
+            'pbrMetallicRoughness': {
+                'baseColorTexture': {'index': len(self.json['textures']) - 1},
+                'metallicFactor': 0.0,
+                'roughnessFactor': 0.5,
+            }
+        }]
+        return len(self.json['materials']) - 1
+
+    def add_mesh(self, name: str, geometry: Geometry, material: Optional[int] = None) -> int:
+        positions, normals, texcoords = to_gltf_space(geometry)
+
+        attributes = {
+            'POSITION': self.add_accessor(positions, 'VEC3', ARRAY_BUFFER, bounds=True),
+            'TEXCOORD_0': self.add_accessor(texcoords, 'VEC2', ARRAY_BUFFER),
+        }
+        # Vertices without an exported normal are left for the viewer to shade flat
+        lengths = np.linalg.norm(normals, axis=1)
+        if len(lengths) and np.all(np.abs(lengths - 1.0) < 1e-3):
+            attributes['NORMAL'] = self.add_accessor(normals, 'VEC3', ARRAY_BUFFER)
+
+        primitive = {
+            'attributes': attributes,
+            'indices': self.add_accessor(geometry.faces.ravel(), 'SCALAR', ELEMENT_ARRAY_BUFFER),
+        }
+        if material is not None:
+            primitive['material'] = material
+
+        self.json['meshes'] += [{'name': name, 'primitives': [primitive]}]
+        return len(self.json['meshes']) - 1
+
+    def add_node(self, name: str, mesh: int, translation=None) -> int:
+        node = {'name': name, 'mesh': mesh}
+        if translation is not None and any(translation):
+            node['translation'] = [float(v) for v in translation]
+
+        self.json['nodes'] += [node]
+        self.json['scenes'][0]['nodes'] += [len(self.json['nodes']) - 1]
+        return len(self.json['nodes']) - 1
+
+    def add_accessor(self, array: np.ndarray, type: str, target: int, bounds: bool = False) -> int:
+        # Indices keep their unsigned type, welded meshes use the smallest one.
+        # Signed indices are written as uint32, attributes as float32.
+        if array.dtype == np.uint8:
+            component, dtype = UNSIGNED_BYTE, '<u1'
+        elif array.dtype == np.uint16:
+            component, dtype = UNSIGNED_SHORT, '<u2'
+        elif array.dtype == np.uint32:
+            component, dtype = UNSIGNED_INT, '<u4'
+        elif np.issubdtype(array.dtype, np.integer):
+            if target != ELEMENT_ARRAY_BUFFER:
+                raise TypeError(f"{array.dtype} vertex attributes aren't supported")
+            if len(array) and not (0 <= array.min() and array.max() <= 0xFFFFFFFF):
+                raise ValueError(f"indices out of the uint32 range: {array.min()}..{array.max()}")
+            component, dtype = UNSIGNED_INT, '<u4'
+        elif np.issubdtype(array.dtype, np.floating):
+            component, dtype = FLOAT, '<f4'
+        else:
+            raise TypeError(f"can't write {array.dtype} accessors")
+
+        array = np.ascontiguousarray(array, dtype=dtype)
+        data = array.tobytes()
+        self.json['bufferViews'] += [{
+            'buffer': 0,
+            'byteOffset': self.length,
+            'byteLength': len(data),
+            'target': target,
+        }]
+
+        accessor = {
+            'bufferView': len(self.json['bufferViews']) - 1,
+            'componentType': component,
+            'count': len(array),
+            'type': type,
+        }
+        if bounds:
+            accessor['min'] = array.min(axis=0).tolist() if len(array) else [0.0] * array.shape[1]
+            accessor['max'] = array.max(axis=0).tolist() if len(array) else [0.0] * array.shape[1]
+        self.json['accessors'] += [accessor]
+
+        # bufferViews start on 4 byte boundaries
+        padding = -len(data) % 4
+        self.chunks += [data, b'\0' * padding]
+        self.length += len(data) + padding
+        return len(self.json['accessors']) - 1
+
+    def write(self, path: Path, embed: bool = True) -> None:
+        """
+        Writes a .gltf to `path`. Embedded files carry the buffer and the
+        images as data URIs (like GLTF_EMBEDDED), otherwise the buffer goes to
+        a .bin and the images are referenced next to the .gltf (GLTF_SEPARATE).
+        """
+        path = Path(path)
+        gltf = dict(self.json)
+        buffer = b''.join(self.chunks)
+
+        if embed:
+            uri = 'data:application/octet-stream;base64,' + base64.b64encode(buffer).decode('ascii')
+        else:
+            uri = path.with_suffix('.bin').name
+            with open(path.with_suffix('.bin'), 'wb') as file:
+                file.write(buffer)
+        gltf['buffers'] = [{'byteLength': len(buffer), 'uri': uri}]
+
+        gltf['images'] = []
+        for name, image_path in self.images:
+            if embed:
+                uri = 'data:image/png;base64,' + base64.b64encode(image_path.read_bytes()).decode('ascii')
+            else:
+                uri = image_path.name
+                copy_image(image_path, path.parent / image_path.name)
+            gltf['images'] += [{'name': name, 'mimeType': 'image/png', 'uri': uri}]
+
+        # glTF forbids empty top level arrays
+        gltf = {key: value for key, value in gltf.items() if value != []}
+        with open(path, 'wt') as file:
+            json.dump(gltf, file, indent=2)
@@ -1,7 +1,10 @@
-import os, sys, glob
+import os, glob
+import argparse
 import wordninja
 from pathlib import Path
 import xml.etree.ElementTree as etree
+from xml_attribs import read_int
+from profiling import add_arguments, from_args
 
 ANIM_SUB_RSCR = """
 [sub_resource type="Animation" id=%d]
@@ -44,12 +47,12 @@ def load_xml(path):
         print(f'[Info] Reading {path}')
         root = etree.fromstring(xml.read())
 
-    size = ( int(root.attrib['width']), int(root.attrib['height']) )
-    actual = ( int(root.attrib['actualWidth']), int(root.attrib['actualHeight']) )
+    size = ( read_int(root, 'width'), read_int(root, 'height') )
+    actual = ( read_int(root, 'actualWidth'), read_int(root, 'actualHeight') )
     
     frames, durations = [], []
     for frame in root.findall('Frames/FramePC'):
-        durations += [int(frame.attrib['duration']) / 10_000 / 1_000]
+        durations += [read_int(frame, 'duration') / 10_000 / 1_000]
         rect = frame.find('Rectangle')
         frames += [ f"Rect2 ({rect.attrib['x']}, {rect.attrib['y']}, {rect.attrib['w']}, {rect.attrib['h']})" ]
 
@@ -67,9 +70,16 @@ def time_sum(durations):
         _sum += d
     return _times, f'{sum(durations):.3}'
 
+parser = argparse.ArgumentParser(
+    description="Generates the AnimationPlayer animations of Gomez from animation XMLs")
+parser.add_argument("path", help="folder with the animation XMLs")
+add_arguments(parser, 'import_anims_as_player')
+args = parser.parse_args()
+profiler = from_args(args)
+
 ext_offset = 1
 offset = 3
-xmls = glob.glob(sys.argv[1] + '\*.xml')
+xmls = glob.glob(os.path.join(args.path, '*.xml'))
 #xmls = glob.glob('Z:\zeffyr\Private\sprites\gomez\idleplay.xml')
 
 ani_internal_exts = '\n[node name="AnimationPlayer" type="AnimationPlayer" parent="."]\n'
@@ -78,7 +88,8 @@ txt_exts = ""
 
 for i, xml in enumerate(xmls):
     name = Path(xml).stem
-    data = load_xml(xml)
+    with profiler.phase('read'):
+        data = load_xml(xml)
     dlen = len(data['frames'])
 
     new_name = "_".join(wordninja.split(name))
@@ -99,7 +110,9 @@ for i, xml in enumerate(xmls):
     
 abs_path = os.path.dirname(__file__)
 txt_path = abs_path + '\\' + 'gomez_player_anis.txt'
-with open(txt_path, 'wt') as txt:
+with profiler.phase('write'), open(txt_path, 'wt') as txt:
     txt.write(txt_exts)
     txt.write(txt_subs)
-    txt.write(ani_internal_exts)
\ No newline at end of file
+    txt.write(ani_internal_exts)
+
+profiler.report(args.profile, 'import_anims_as_player', input=args.path)
\ No newline at end of file
@@ -1,6 +1,14 @@
-import sys
+import io
+import argparse
+import multiprocessing as mp
 import xml.etree.ElementTree as etree
 from pathlib import Path, PurePath
+from typing import List
+from xml_attribs import read_float, read_int
+from profiling import Profiler, add_arguments
+from batching import run_batch
+
+BUFFER_SIZE = 1 << 20
 
 TRES_HEADER = """[gd_resource type="SpriteFrames" load_steps={} format=2]"""
 TRES_RESOURCE = """[ext_resource path="res://assets/Character Animations/{}/{}.ani.png" type="Texture" id={}]"""
@@ -25,13 +33,13 @@ def load_xml(path):
         print('[Read]', path)
         root = etree.fromstring(xml.read())
 
-    size = (int(root.attrib['width']), int(root.attrib['height']))
-    actual = (int(root.attrib['actualWidth']),
-              int(root.attrib['actualHeight']))
+    size = (read_int(root, 'width'), read_int(root, 'height'))
+    actual = (read_int(root, 'actualWidth'),
+              read_int(root, 'actualHeight'))
 
     frames, duration = [], 0
     for frame in root.findall('Frames/FramePC'):
-        duration += float(frame.attrib['duration']) / 10_000 / 1000
+        duration += read_float(frame, 'duration') / 10_000 / 1000
         rect = frame.find('Rectangle')
         frames += [(rect.attrib['x'], rect.attrib['y'],
                     rect.attrib['w'], rect.attrib['h'])]
@@ -44,49 +52,92 @@ def load_xml(path):
     }
 
 
-#root = Path("D:\\Zeffyr\\tools\\anims").resolve()
-root = Path(sys.argv[1]).resolve()
-
-# Group xmls by NPC
-groups = {}
-for child in root.glob('**/*'):
-    if child.is_dir():
-        groups[child.stem] = [path.resolve() for path in child.rglob("*.xml") if "metadata" not in str(path)]
-
-# Generate unique .tres for each animation
-for name, xmls in groups.items():
+def generate_tres(xmls, profiler):
     tres_exts, tres_subs, tres_anis = [], [], [ RSCR_ANI_HEADER ]
-    tres_steps = 1
-    
+    regions = {}
+
     for i, xml in enumerate(xmls):
-        data = load_xml(str(xml))
+        with profiler.phase('read'):
+            data = load_xml(str(xml))
         anis = []
 
         tres_exts += [ TRES_RESOURCE.format(xml.parent.stem, xml.stem, i+1) ]
         for frame in data['frames']:
-            tres_subs += [ ATLAS_SUB_RSRC.format(tres_steps, i+1, ", ".join(frame)) ]
-            anis += [ f'SubResource( {tres_steps} )' ]
-            tres_steps += 1
+            # Repeated frames of an atlas share one AtlasTexture
+            region = (i+1, frame)
+            if region not in regions:
+                regions[region] = len(regions) + 1
+                tres_subs += [ ATLAS_SUB_RSRC.format(regions[region], i+1, ", ".join(frame)) ]
+            anis += [ f'SubResource( {regions[region]} )' ]
 
         tres_anis += [ RSRC_ANIMATIONS.format(', '.join(anis), xml.stem, 7.0) ]
-        
+
         if (i != len(xmls) - 1):
             tres_anis += ['}, {']
         else:
             tres_anis += ['} ]']
 
-    tres_header = TRES_HEADER.format(tres_steps + len(xmls))
-    tres_path = str(PurePath(xml.parent, name)) + ".tres"
-    
-    tres_exts = "\n".join(tres_exts)
-    tres_subs = "\n".join(tres_subs)
-    tres_anis = "\n".join(tres_anis)
-
-    print("[Write]", tres_path)
-    print("*" * 40)
-    
-    with open(tres_path, 'wt') as tres:
-        print(tres_header, file=tres, end="\n\n")
-        print(tres_exts, file=tres, end="\n\n")
-        print(tres_subs, file=tres)
-        print(tres_anis, file=tres)
\ No newline at end of file
+    tres_header = TRES_HEADER.format(len(tres_subs) + len(xmls) + 1)
+    return tres_header, tres_exts, tres_subs, tres_anis
+
+
+def write_tres(tres_path, tres_header, tres_exts, tres_subs, tres_anis):
+    # One buffered write of the whole resource
+    tres = io.StringIO()
+    tres.write(tres_header + "\n\n")
+    tres.write("\n".join(tres_exts) + "\n\n")
+    tres.write("\n".join(tres_subs) + "\n")
+    tres.write("\n".join(tres_anis) + "\n")
+
+    with open(tres_path, 'wt', buffering=BUFFER_SIZE) as file:
+        file.write(tres.getvalue())
+
+
+def find_xmls(folder: Path) -> List[Path]:
+    return [path.resolve() for path in folder.rglob("*.xml") if "metadata" not in str(path)]
+
+
+def convert_character(folder: Path, profiler: Profiler) -> str:
+    xmls = find_xmls(folder)
+    tres_path = str(PurePath(xmls[-1].parent, folder.stem)) + ".tres"
+
+    tres = generate_tres(xmls, profiler)
+
+    with profiler.phase('write'):
+        write_tres(tres_path, *tres)
+    return tres_path
+
+
+def collect_characters(root: Path) -> List[Path]:
+    # One .tres per NPC folder
+    folders = {}
+    for child in root.glob('**/*'):
+        if child.is_dir():
+            folders[child.stem] = child
+    return list(folders.values())
+
+
+if __name__ == '__main__':
+    mp.freeze_support()
+
+    parser = argparse.ArgumentParser(
+        description="Generates SpriteFrames resources from character animation XMLs")
+    parser.add_argument("path", help="folder with one subfolder per character")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: all cores)")
+    add_arguments(parser, 'import_anims_as_sprite')
+    args = parser.parse_args()
+
+    #root = Path("D:\\Zeffyr\\tools\\anims").resolve()
+    root = Path(args.path).resolve()
+
+    characters = []
+    for folder in collect_characters(root):
+        if find_xmls(folder):
+            characters += [folder]
+        else:
+            print(f"[Skip] {folder.name} (no animations)")
+
+    # Generate unique .tres for each animation
+    exit(run_batch(characters, convert_character, 'import_anims_as_sprite', 'characters',
+                   'Character', args.jobs, profile=args.profile, cprofile=args.cprofile, quiet=True))
@@ -1,82 +1,104 @@
+import os
 import sys
+import json
+import argparse
+import multiprocessing as mp
 import xml.etree.ElementTree as etree
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional, NamedTuple
+from functools import lru_cache, partial
 from pathlib import Path
 from dataclasses import dataclass
-from struct import pack
-from godot_parser import GDScene, Node, GDObject, NodePath, ExtResource
+from array import array
+from struct import pack, unpack
+from godot_parser import GDObject, NodePath
+from tscn_writer import TscnWriter, SceneNode, Reference, PoolIntArray
+from xml_attribs import read_bool, read_float, read_int
+from profiling import Profiler, add_arguments
+from batching import BuildManifest, collect_inputs, file_hash, run_batch
 from PIL import ImageColor
 
 
-@dataclass(order=True)
-class Vec3:
+class Vec3(NamedTuple):
     x: float = 0.0
     y: float = 0.0
     z: float = 0.0
 
     def from_xml(xml):
-        x = float(xml.attrib['x'])
-        y = float(xml.attrib['y'])
-        z = float(xml.attrib['z'])
+        x = read_float(xml, 'x')
+        y = read_float(xml, 'y')
+        z = read_float(xml, 'z')
         return Vec3(x, y, z)
 
     def to_obj(self) -> GDObject:
         return GDObject("Vector3", self.x, self.y, self.z)
 
 
-@dataclass(order=True)
-class Quat:
+class Quat(NamedTuple):
     x: float = 0.0
     y: float = 0.0
     z: float = 0.0
     w: float = 0.0
 
     def from_xml(xml):
-        x = float(xml.attrib['x'])
-        y = float(xml.attrib['y'])
-        z = float(xml.attrib['z'])
-        w = float(xml.attrib['w'])
+        x = read_float(xml, 'x')
+        y = read_float(xml, 'y')
+        z = read_float(xml, 'z')
+        w = read_float(xml, 'w')
         return Quat(x, y, z, w)
 
     def to_obj(self) -> GDObject:
         return GDObject("Quat", self.x, self.y, self.z, self.w)
 
 
-@dataclass(order=True)
-class Transform:
-    matrix: List[int]
+def rotation_basis(rot: Tuple[float, float, float, float],
+                   scl: Tuple[float, float, float]) -> Tuple[float, ...]:
+    # The key is packed so that -0.0 and 0.0 don't share a basis, as they
+    # print differently
+    return packed_basis(pack('<7d', *rot, *scl))
 
-    def form(pos: Vec3 = Vec3(0, 0, 0), rot: Quat = Quat(0, 0, 0, 1), scl: Vec3 = Vec3(1, 1, 1)):
-        matrix = list(range(12))
 
-        xx = rot.x * rot.x
-        xy = rot.x * rot.y
-        xz = rot.x * rot.z
-        yy = rot.y * rot.y
-        zz = rot.z * rot.z
-        yz = rot.y * rot.z
+# A level only uses a handful of distinct rotations and scales, the bound
+# keeps long-lived pool workers from piling up the bases of every level
+@lru_cache(maxsize=1024)
+def packed_basis(key: bytes) -> Tuple[float, ...]:
+    x, y, z, w, *scl = unpack('<7d', key)
 
-        wx = rot.w * rot.x
-        wy = rot.w * rot.y
-        wz = rot.w * rot.z
+    xx = x * x
+    xy = x * y
+    xz = x * z
+    yy = y * y
+    zz = z * z
+    yz = y * z
 
-        matrix[0] = scl.x * (1.0 - 2.0*(yy + zz))
-        matrix[1] = scl.x * (2.0*(xy - wz))
-        matrix[2] = scl.x * (2.0*(xz + wy))
+    wx = w * x
+    wy = w * y
+    wz = w * z
 
-        matrix[3] = scl.y * (2.0*(xy + wz))
-        matrix[4] = scl.y * (1.0 - 2.0*(xx + zz))
-        matrix[5] = scl.y * (2.0*(yz - wx))
+    return (
+        scl[0] * (1.0 - 2.0*(yy + zz)),
+        scl[0] * (2.0*(xy - wz)),
+        scl[0] * (2.0*(xz + wy)),
 
-        matrix[6] = scl.z * (2.0*(xz - wy))
-        matrix[7] = scl.z * (2.0*(yz + wx))
-        matrix[8] = scl.z * (1.0 - 2.0*(xx + yy))
+        scl[1] * (2.0*(xy + wz)),
+        scl[1] * (1.0 - 2.0*(xx + zz)),
+        scl[1] * (2.0*(yz - wx)),
 
-        matrix[9] = pos.x
-        matrix[10] = pos.y
-        matrix[11] = pos.z
+        scl[2] * (2.0*(xz - wy)),
+        scl[2] * (2.0*(yz + wx)),
+        scl[2] * (1.0 - 2.0*(xx + yy)),
+    )
 
-        return Transform(matrix)
+
+ROUND_DIGITS = (4,) * 12
+
+
+@dataclass(order=True)
+class Transform:
+    matrix: List[float]
+
+    def form(pos: Vec3 = Vec3(0, 0, 0), rot: Quat = Quat(0, 0, 0, 1), scl: Vec3 = Vec3(1, 1, 1)):
+        basis = rotation_basis(rot, scl)
+        return Transform([*basis, pos.x, pos.y, pos.z])
 
     def ones():
         matrix = [0 for i in range(12)]
@@ -84,11 +106,12 @@ class Transform:
         return Transform(matrix)
 
     def to_obj(self) -> GDObject:
-        rounded = [round(m, 4) for m in self.matrix]
-        return GDObject("Transform", *rounded)
+        return GDObject("Transform", *map(round, self.matrix, ROUND_DIGITS))
 
 
 class Volume:
+    __slots__ = ('key', 'start', 'end', 'faces')
+
     def __init__(self, xml) -> None:
         volume = xml.find('Volume')
 
@@ -116,17 +139,125 @@ class Volume:
         return (size, pos)
 
 
-class Trile:
-    def __init__(self, xml, trileset: list) -> None:
-        self.id1 = xml.attrib['trileId']
-        self.id2 = int(trileset[0].index(self.id1))
-        self.name = trileset[1][self.id2]
-        self.rot = int(xml.attrib['orientation'])
-        self.pos = Vec3.from_xml(xml.find('Position/Vector3'))
-        pass
+class TrilesetIndex:
+    """
+    Maps trile keys of a trileset to their (id, name) pairs, where id is
+    the position of the trile in the trileset XML (and the MeshLibrary).
+    """
+    INDICES: Dict[Path, 'TrilesetIndex'] = {}
+
+    def __init__(self, keys: List[str], names: List[str]) -> None:
+        self.keys = keys
+        self.names = names
+        self.ids: Dict[str, Tuple[int, str]] = {}
+        for i, key in enumerate(keys):
+            self.ids.setdefault(key, (i, names[i]))
+
+        # Keys and cubes are collectibles, not GridMap cells
+        self.hidden = {i for i, name in enumerate(names)
+                       if 'key' in name.lower() or 'cube' in name.lower()}
+
+    def __getitem__(self, key: str) -> Tuple[int, str]:
+        return self.ids[key]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def from_xml(path: Path) -> 'TrilesetIndex':
+        keys = []
+        names = []
+        for _, entry in etree.iterparse(path):
+            if entry.tag == 'TrileEntry':
+                keys += [entry.attrib['key']]
+                names += [entry.find('Trile').attrib['name']]
+                entry.clear()
+        return TrilesetIndex(keys, names)
+
+    def load(path: Path, sidecar: bool = False) -> 'TrilesetIndex':
+        # Built once per trileset and process, then shared by every level
+        if path in TrilesetIndex.INDICES:
+            return TrilesetIndex.INDICES[path]
+
+        index = TrilesetIndex.read_sidecar(path) if sidecar else None
+        if index is None:
+            index = TrilesetIndex.from_xml(path)
+            if sidecar:
+                index.write_sidecar(path)
+
+        TrilesetIndex.INDICES[path] = index
+        return index
+
+    def sidecar_path(path: Path) -> Path:
+        return path.with_suffix('.index.json')
+
+    def read_sidecar(path: Path) -> Optional['TrilesetIndex']:
+        sidecar = TrilesetIndex.sidecar_path(path)
+        try:
+            with open(sidecar, 'rt') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        index = TrilesetIndex(data['keys'], data['names'])
+
+        # mtime is the cheap check, the hash catches touched but unchanged files.
+        # Those get the new mtime, so the next run doesn't hash them again.
+        if data.get('mtime') != path.stat().st_mtime_ns:
+            sha1 = file_hash(path)
+            if data.get('sha1') != sha1:
+                return None
+            index.write_sidecar(path, sha1)
+        return index
+
+    def write_sidecar(self, path: Path, sha1: Optional[str] = None) -> None:
+        data = {
+            'mtime': path.stat().st_mtime_ns,
+            'sha1': sha1 or file_hash(path),
+            'keys': self.keys,
+            'names': self.names,
+        }
+
+        # Pool workers may all write the same index, each one through its own
+        # temp file, so readers never see a partial one
+        sidecar = TrilesetIndex.sidecar_path(path)
+        temp = sidecar.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            with open(temp, 'wt') as file:
+                json.dump(data, file)
+            os.replace(temp, sidecar)
+        except OSError as e:
+            print(f"[Warning] Can't write the trileset index: {e}")
+
+
+class TrileTable:
+    """
+    Trile instances stored column by column, one typed array per field,
+    instead of one object per trile.
+    """
+
+    def __init__(self, trileset: TrilesetIndex) -> None:
+        self.trileset = trileset
+        self.x = array('d')
+        self.y = array('d')
+        self.z = array('d')
+        self.id = array('H')
+        self.rot = array('B')
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def add(self, xml) -> None:
+        pos = xml.find('Position/Vector3')
+        self.x.append(read_float(pos, 'x'))
+        self.y.append(read_float(pos, 'y'))
+        self.z.append(read_float(pos, 'z'))
+        self.id.append(self.trileset[xml.attrib['trileId']][0])
+        self.rot.append(read_int(xml, 'orientation'))
 
 
 class Art:
+    __slots__ = ('key', 'name', 'pos', 'scale', 'rot')
+
     def __init__(self, xml) -> None:
         self.key = xml.attrib['key']
         self.name = xml.find('ArtObjectInstance').attrib['name'].lower()
@@ -139,6 +270,9 @@ class Art:
 
 
 class Plane:
+    __slots__ = ('key', 'pos', 'scale', 'rot', 'repeat', 'animated', 'name',
+                 'dsided', 'opacity', 'billboard', 'filter', 'actor')
+
     def __init__(self, xml) -> None:
         self.key = xml.attrib['key']
         pl = xml.find("BackgroundPlane")
@@ -148,31 +282,34 @@ class Plane:
         self.rot = Quat.from_xml(pl.find('Rotation/Quaternion'))
 
         self.repeat = (
-            eval(pl.attrib['xTextureRepeat']),
-            eval(pl.attrib['yTextureRepeat'])
+            read_bool(pl, 'xTextureRepeat'),
+            read_bool(pl, 'yTextureRepeat')
         )
-        self.animated = eval(pl.attrib['animated'])
+        self.animated = read_bool(pl, 'animated')
         self.name = pl.attrib['textureName'].lower()
-        self.dsided = eval(pl.attrib['doubleSided'])
-        self.opacity = float(pl.attrib['opacity'])
-        self.billboard = eval(pl.attrib['billboard'])
+        self.dsided = read_bool(pl, 'doubleSided')
+        self.opacity = read_float(pl, 'opacity')
+        self.billboard = read_bool(pl, 'billboard')
         self.filter = pl.attrib['filter']
         self.actor = pl.attrib['actorType']
         pass
 
 
 class Group:
-    def __init__(self, xml, trileset) -> None:
+    def __init__(self, xml, trileset: TrilesetIndex) -> None:
         self.key = xml.attrib['key']
         self.actor = xml.find('TrileGroup').attrib['actorType']
 
-        self.triles = []
+        self.triles = TrileTable(trileset)
         for trile in xml.findall('TrileGroup/Triles/TrileInstance'):
-            self.triles += [Trile(trile, trileset)]
+            self.triles.add(trile)
         pass
 
 
 class Npc:
+    __slots__ = ('key', 'pos', 'dest', 'name', 'walk', 'random', 'once',
+                 'avoid', 'actor', 'lines', 'actions')
+
     def __init__(self, xml) -> None:
         instance = xml.find("NpcInstance")
 
@@ -181,10 +318,10 @@ class Npc:
         self.dest = Vec3.from_xml(instance.find('DestinationOffset/Vector3'))
 
         self.name = instance.attrib['name']
-        self.walk = float(instance.attrib['walkSpeed'])
-        self.random = eval(instance.attrib['randomizeSpeech'])
-        self.once = eval(instance.attrib['sayFirstSpeechLineOnce'])
-        self.avoid = eval(instance.attrib['avoidsGomez'])
+        self.walk = read_float(instance, 'walkSpeed')
+        self.random = read_bool(instance, 'randomizeSpeech')
+        self.once = read_bool(instance, 'sayFirstSpeechLineOnce')
+        self.avoid = read_bool(instance, 'avoidsGomez')
         self.actor = instance.attrib['actorType']
 
         self.lines = []
@@ -232,57 +369,86 @@ class Attributes:
 
 
 class Level:
-    def __init__(self, path, path2) -> None:
-        tree = etree.parse(path)
-        root = tree.getroot()
+    # Root children needed by Attributes, everything else is dropped once read
+    ROOT_KEEP = ('StartingPosition', 'Size')
 
+    def __init__(self, path, path2, index_cache: bool = False) -> None:
         self.trile_path = path2
-        self.attribs = Attributes(root)
-
-        trileset = self.read_trileset(self.attribs.trileset)
+        self.index_cache = index_cache
 
         self.volumes = []
-        for volume in root.findall('Volumes/Entry'):
-            self.volumes += [Volume(volume)]
-
-        self.triles = []
-        for trile in root.findall('Triles/Entry/TrileInstance'):
-            self.triles += [Trile(trile, trileset)]
-
+        self.triles = None
         self.arts = []
-        for art in root.findall('ArtObjects/Entry'):
-            self.arts += [Art(art)]
-
         self.planes = []
-        for plane in root.findall('BackgroundPlanes/Entry'):
-            self.planes += [Plane(plane)]
-
         self.groups = []
-        for group in root.findall('Groups/Entry'):
-            self.groups += [Group(group, trileset)]
-
         self.npcs = []
-        for npc in root.findall('NonplayerCharacters/Entry'):
-            self.npcs += [Npc(npc)]
-
         self.tracks = []
-        for track in root.findall('AmbienceTracks/AmbienceTrack'):
-            self.tracks += [Track(track)]
+        self.read_level(path)
         pass
 
-    def read_trileset(self, name):
+    def read_level(self, path) -> None:
+        # Single streaming pass: every collection entry is turned into its
+        # model as soon as it is closed and then detached from the tree, so
+        # only the entry being read is ever kept in memory.
+        stack = []
+        trileset = None
+
+        for event, elem in etree.iterparse(path, events=('start', 'end')):
+            if event == 'start':
+                if not stack:
+                    trileset = self.read_trileset(
+                        elem.attrib['trileSetName'].lower())
+                    self.triles = TrileTable(trileset)
+                stack += [elem]
+                continue
+
+            stack.pop()
+            depth = len(stack)
+
+            if depth == 0:
+                self.attribs = Attributes(elem)
+                elem.clear()
+
+            elif depth == 1:
+                if elem.tag not in Level.ROOT_KEEP:
+                    elem.clear()
+                    stack[0].remove(elem)
+
+            elif depth == 2:
+                parent = stack[1]
+                if parent.tag in Level.ROOT_KEEP:
+                    continue
+
+                section = (parent.tag, elem.tag)
+                if section == ('Volumes', 'Entry'):
+                    self.volumes += [Volume(elem)]
+                elif section == ('Triles', 'Entry'):
+                    for trile in elem.findall('TrileInstance'):
+                        self.triles.add(trile)
+                elif section == ('ArtObjects', 'Entry'):
+                    self.arts += [Art(elem)]
+                elif section == ('BackgroundPlanes', 'Entry'):
+                    self.planes += [Plane(elem)]
+                elif section == ('Groups', 'Entry'):
+                    self.groups += [Group(elem, trileset)]
+                elif section == ('NonplayerCharacters', 'Entry'):
+                    self.npcs += [Npc(elem)]
+                elif section == ('AmbienceTracks', 'AmbienceTrack'):
+                    self.tracks += [Track(elem)]
+
+                elem.clear()
+                parent.remove(elem)
+
+    def read_trileset(self, name) -> TrilesetIndex:
         trile_path = Path(self.trile_path, name).with_suffix('.xml')
-        tree = etree.parse(trile_path)
-        root = tree.getroot()
+        return TrilesetIndex.load(trile_path, self.index_cache)
 
-        keys = []
-        names = []
-        for entry in root.iter('TrileEntry'):
-            keys += [entry.attrib['key']]
-            names += [entry.find('Trile').attrib['name']]
 
-        return [keys, names]
+# Bump whenever the generated scenes change, so incremental builds redo them
+CONVERTER_VERSION = 1
 
+# .meshlib is converted in the editor, .tres is written by export_meshlib.py
+MESHLIB_SUFFIX = '.meshlib'
 
 ROT_INDICES = [10, 22, 0, 16]
 FACE_INDICES = {
@@ -296,27 +462,38 @@ FACE_INDICES = {
 class GodotScene:
     level: Level
     path: Path
-    scene: GDScene
-
-    def __init__(self, level: Path, triles: Path) -> None:
-        self.level = Level(level, triles)
+    scene: TscnWriter
+
+    def __init__(self, level: Path, triles: Path, index_cache: bool = False,
+                 profiler: Optional[Profiler] = None, meshlib: str = MESHLIB_SUFFIX) -> None:
+        self.profiler = profiler or Profiler()
+        self.meshlib = meshlib
+        with self.profiler.phase('read'):
+            self.level = Level(level, triles, index_cache)
         self.path = level.with_suffix(".tscn")
-        self.scene = GDScene()
+        self.scene = TscnWriter()
         pass
 
     def make_scene(self) -> None:
-        node: Node
-        parent: Node
+        with self.profiler.phase('resources'):
+            root = self.make_tree()
+        with self.profiler.phase('write'):
+            self.scene.write(self.path, root)
+        pass
+
+    def make_tree(self) -> SceneNode:
+        node: SceneNode
+        parent: SceneNode
 
         gomez_rsrc = self.scene.add_ext_resource(
             "res://scenes/Gomez.tscn", "PackedScene")
         camera_rsrc = self.scene.add_ext_resource(
             "res://scenes/GameCamera.tscn", "PackedScene")
 
-        gomez = Node("Gomez", instance=gomez_rsrc.reference.id, properties={
+        gomez = SceneNode("Gomez", instance=gomez_rsrc.reference.id, properties={
             "transform": Transform.form(self.level.attribs.start).to_obj()
         })
-        camera = Node("GameCamera", instance=camera_rsrc.reference.id, properties={
+        camera = SceneNode("GameCamera", instance=camera_rsrc.reference.id, properties={
             "PixelsPerTrixel": 2,
             "TargetPath": NodePath("../Gomez")
         })
@@ -325,13 +502,13 @@ class GodotScene:
         if (self.level.attribs.water_type != 'None'):
             water_rsrc = self.scene.add_ext_resource(
                 "res://scenes/Water.tscn", "PackedScene")
-            water = Node("Water", instance=water_rsrc.reference, properties={
+            water = SceneNode("Water", instance=water_rsrc.reference, properties={
                 "Height": self.level.attribs.water_height,
                 "Type": self.level.attribs.water_type,
             })
 
         meshlib = self.scene.add_ext_resource(
-            f"res://assets/Trilesets/{self.level.attribs.trileset}.meshlib", "MeshLibrary")
+            f"res://assets/Trilesets/{self.level.attribs.trileset}{self.meshlib}", "MeshLibrary")
 
         triles = self.make_triles(meshlib.reference)
         groups = self.make_groups(meshlib.reference)
@@ -340,57 +517,55 @@ class GodotScene:
         volumes = self.make_volumes()
         npcs = self.make_npcs()
 
-        with self.scene.use_tree() as tree:
-            tree.root = Node(self.level.attribs.name, "Spatial")
-            tree.root.add_child(triles)
-            if (water):
-                tree.root.add_child(water)
-            tree.root.add_child(gomez)
-            tree.root.add_child(camera)
-
-            parent = Node("Groups", "Spatial")
-            for node in groups:
-                parent.add_child(node)
-            tree.root.add_child(parent)
-
-            parent = Node("Arts", "Spatial")
-            for node in arts:
-                parent.add_child(node)
-            tree.root.add_child(parent)
-
-            parent = Node("Planes", "Spatial")
-            for node in planes:
-                parent.add_child(node)
-            tree.root.add_child(parent)
-
-            parent = Node("Volumes", "Spatial")
-            for node in volumes:
-                parent.add_child(node)
-            tree.root.add_child(parent)
-
-            parent = Node("Npcs", "Spatial")
-            for node in npcs:
-                parent.add_child(node)
-            tree.root.add_child(parent)
-
-        self.scene.write(self.path)
-        pass
-
-    def make_triles(self, ext: ExtResource) -> Node:
+        root = SceneNode(self.level.attribs.name, "Spatial")
+        root.add_child(triles)
+        if (water):
+            root.add_child(water)
+        root.add_child(gomez)
+        root.add_child(camera)
+
+        parent = SceneNode("Groups", "Spatial")
+        for node in groups:
+            parent.add_child(node)
+        root.add_child(parent)
+
+        parent = SceneNode("Arts", "Spatial")
+        for node in arts:
+            parent.add_child(node)
+        root.add_child(parent)
+
+        parent = SceneNode("Planes", "Spatial")
+        for node in planes:
+            parent.add_child(node)
+        root.add_child(parent)
+
+        parent = SceneNode("Volumes", "Spatial")
+        for node in volumes:
+            parent.add_child(node)
+        root.add_child(parent)
+
+        parent = SceneNode("Npcs", "Spatial")
+        for node in npcs:
+            parent.add_child(node)
+        root.add_child(parent)
+
+        return root
+
+    def make_triles(self, ext: Reference) -> SceneNode:
         return self.generate_gridmap('Triles', self.level.triles, ext)
 
-    def make_groups(self, ext: ExtResource) -> List[Node]:
+    def make_groups(self, ext: Reference) -> List[SceneNode]:
         group: Group
-        groups: List[Node] = []
+        groups: List[SceneNode] = []
 
         for group in self.level.groups:
             gridmap = self.generate_gridmap(group.key, group.triles, ext)
             groups += [gridmap]
         return groups
 
-    def make_arts(self) -> List[Node]:
+    def make_arts(self) -> List[SceneNode]:
         art: Art
-        arts: List[Node] = []
+        arts: List[SceneNode] = []
         dict1: Dict = {}
 
         names = {art.name for art in self.level.arts}
@@ -400,14 +575,13 @@ class GodotScene:
 
         for art in self.level.arts:
             transform = Transform.form(art.pos, art.rot, art.scale)
-
-            instance = Node(art.key, instance=dict1[art.name].reference.id, properties={
+            instance = SceneNode(art.key, instance=dict1[art.name].reference.id, properties={
                 "transform": transform.to_obj()
             })
             arts += [instance]
         return arts
 
-    def make_planes(self) -> List[Node]:
+    def make_planes(self) -> List[SceneNode]:
         plane: Plane
         planes: List[Plane] = []
         dict1: Dict = {}
@@ -445,11 +619,11 @@ class GodotScene:
             else:
                 props['texture'] = dict2[plane.name].reference
 
-            sprite = Node(plane.name, type=typeof, properties=props)
+            sprite = SceneNode(plane.name, type=typeof, properties=props)
             planes += [sprite]
         return planes
 
-    def make_volumes(self) -> List[Node]:
+    def make_volumes(self) -> List[SceneNode]:
         volume: Volume
         volumes: List[Volume] = []
 
@@ -461,17 +635,17 @@ class GodotScene:
             boxshape = self.scene.add_sub_resource('BoxShape')
             boxshape.properties['extents'] = size.to_obj()
 
-            area = Node(volume.key, 'Area', properties={
+            area = SceneNode(volume.key, 'Area', properties={
                 "transform": transform.to_obj(),
             })
-            area.add_child(Node("Shape", "CollisionShape", properties={
+            area.add_child(SceneNode("Shape", "CollisionShape", properties={
                 "shape": boxshape.reference
             }))
 
             volumes += [area]
         return volumes
 
-    def make_npcs(self) -> List[Node]:
+    def make_npcs(self) -> List[SceneNode]:
         npc: Npc
         name: str
         npcs: List[Npc] = []
@@ -501,7 +675,7 @@ class GodotScene:
                 name += str(i)
                 i += 1
 
-            npc_instance = Node(name, "AnimatedSprite3D", properties={
+            npc_instance = SceneNode(name, "AnimatedSprite3D", properties={
                 "transform": transform.to_obj(),
                 "pixel_size": 0.0625,
                 "frames": frames,
@@ -517,20 +691,11 @@ class GodotScene:
             npcs += [npc_instance]
         return npcs
 
-    def generate_gridmap(self, name: str, triles: List[Trile], ext: ExtResource) -> Node:
+    def generate_gridmap(self, name: str, triles: TrileTable, ext: Reference) -> SceneNode:
         transform = Transform.form(Vec3(0.5, 0.5, 0.5))
-        cells: List[str] = []
-        trile: Trile
-
-        for trile in triles:
-            if ('key' in trile.name.lower() or 'cube' in trile.name.lower()):
-                continue
-
-            rot = ROT_INDICES[trile.rot]
-            cell = self.generate_gridmap_cell(trile.pos, trile.id2, rot)
-            cells += cell
+        cells = self.encode_gridmap_cells(triles)
 
-        gridmap = Node(name, 'GridMap', properties={
+        gridmap = SceneNode(name, 'GridMap', properties={
             "transform": transform.to_obj(),
             "mesh_library": ext,
             "cell_size": Vec3(1, 1, 1).to_obj(),
@@ -540,24 +705,37 @@ class GodotScene:
             "collision_layer": 0,
             "collision_mask": 0,
             "data": {
-                "cells": GDObject("PoolIntArray", *cells)
+                "cells": PoolIntArray(cells)
             }
         })
         return gridmap
 
-    def generate_gridmap_cell(self, pos: Vec3, id: int, rot: int):
-        # pos -> 64bit (unsigned 16bit for x, y, z) -> index (i1, i2)
-        # id, rot ->  32bit (8bit lsb for id, rot) -> cell (i3)
+    def encode_gridmap_cells(self, triles: TrileTable) -> array:
+        # pos -> 64bit (signed 16bit for x, y, z) -> index (i1, i2)
+        # id, rot ->  32bit (16bit for id, rot) -> cell (i3)
         # 10100000 (?) 00010110 (rot) 00000000 (?) 11010000 (id)
+        #
+        # Every cell is six 16bit words `x, y, z, 0, id, rot` (x, y, z as
+        # two's complement), which is exactly the little-endian layout of
+        # (i1, i2, i3). No per-size struct format, those stay cached in the
+        # struct module and cost tens of MB on big levels.
+        values: List[int] = []
+        hidden = triles.trileset.hidden
+
+        for x, y, z, id, rot in zip(triles.x, triles.y, triles.z, triles.id, triles.rot):
+            if id in hidden:
+                continue
 
-        double = pack('3h', int(pos.x), int(pos.y), int(pos.z))
-        single = pack('2H', id, rot)
-
-        i1 = int.from_bytes(double[:4], "little")
-        i2 = int.from_bytes(double[4:], "little")
-        i3 = int.from_bytes(single, "little")
+            values += (int(x) & 0xFFFF, int(y) & 0xFFFF, int(z) & 0xFFFF,
+                       0, id, ROT_INDICES[rot])
 
-        return [i1, i2, i3]
+        words = array('H', values)
+        if sys.byteorder == 'big':
+            words.byteswap()
+        cells = array('I', words.tobytes())
+        if sys.byteorder == 'big':
+            cells.byteswap()
+        return cells
 
     def convert_color8(self, color: str):
         color = ImageColor.getrgb(color)
@@ -565,11 +743,76 @@ class GodotScene:
         return GDObject('Color', *values)
 
 
-if (len(sys.argv) <= 0):
-    exit(-1)
+class LevelManifest(BuildManifest):
+    """
+    Build manifest of the level scenes, which also depend on their trileset
+    and on the MeshLibrary they reference.
+    """
+
+    def __init__(self, path: Path, triles: Path, meshlib: str = MESHLIB_SUFFIX) -> None:
+        super().__init__(path, CONVERTER_VERSION)
+        self.triles = triles
+        self.meshlib = meshlib
+
+    def inputs(self, level: Path) -> Dict:
+        trileset = Path(self.triles, read_trileset_name(level)).with_suffix('.xml')
+        return {
+            'level': self.file_hash(level),
+            'trileset': self.file_hash(trileset),
+            'meshlib': self.meshlib,
+            'version': self.version,
+        }
+
 
-path = sys.argv[1]
-xml_path = Path(path).resolve()
-trile_path = Path("Z:\\zeffyr\\Fez Assets\\trile sets").resolve()
-godot = GodotScene(xml_path, trile_path)
-godot.make_scene()
+def read_trileset_name(path: Path) -> str:
+    # Only the root start tag is needed, so stop right after it
+    for _, root in etree.iterparse(path, events=('start',)):
+        return root.attrib['trileSetName'].lower()
+
+
+def convert_level(path: Path, profiler: Profiler, triles: Path,
+                  index_cache: bool = False, meshlib: str = MESHLIB_SUFFIX) -> None:
+    godot = GodotScene(path, triles, index_cache, profiler, meshlib)
+    godot.make_scene()
+
+
+if __name__ == '__main__':
+    mp.freeze_support()
+
+    parser = argparse.ArgumentParser(
+        description="Converts FEZ level XMLs into Godot scenes")
+    parser.add_argument("levels", nargs='+',
+                        help="level XML files, directories or glob patterns")
+    parser.add_argument("--triles", default="Z:\\zeffyr\\Fez Assets\\trile sets",
+                        help="directory with the trileset XMLs")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument("--index-cache", action="store_true",
+                        help="keep trileset indices in .index.json sidecars next to the XMLs")
+    parser.add_argument("--manifest", default=None,
+                        help="build manifest for incremental rebuilds "
+                             "(default: import_level2.json next to the first level)")
+    parser.add_argument("--meshlib", choices=[".meshlib", ".tres"], default=MESHLIB_SUFFIX,
+                        help="MeshLibrary the GridMaps use: converted in the editor (.meshlib) "
+                             "or written by export_meshlib.py (.tres)")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild every level, even if it is up to date")
+    add_arguments(parser, 'import_level2')
+    args = parser.parse_args()
+
+    levels = collect_inputs(args.levels)
+    if not levels:
+        print("No level XMLs found ...")
+        exit(-1)
+
+    trile_path = Path(args.triles).resolve()
+    manifest_path = Path(args.manifest or levels[0].with_name("import_level2.json"))
+    manifest = LevelManifest(manifest_path.resolve(), trile_path, args.meshlib)
+    if args.force:
+        for level in levels:
+            manifest.update(level, None)
+
+    convert = partial(convert_level, triles=trile_path,
+                      index_cache=args.index_cache, meshlib=args.meshlib)
+    exit(run_batch(levels, convert, 'import_level2', 'levels', 'Level', args.jobs,
+                   manifest, args.profile, args.cprofile))
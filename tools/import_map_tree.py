@@ -1,5 +1,11 @@
-import os, sys, json
+import os, sys, json, argparse
+from array import array
+from typing import Dict, List, NamedTuple, Tuple
 import xml.etree.ElementTree as etree
+from godot_parser import GDObject
+from tscn_writer import TscnWriter, PoolIntArray
+from xml_attribs import read_bool, read_enum, read_float, read_int
+from profiling import Profiler, add_arguments, from_args
 
 SIZES = {
     "Lesser": 1.0,
@@ -16,6 +22,10 @@ OFFSETS = {
     "Front": "0, 0, %d",
 }
 
+# The same offsets as vectors, in FACES order, for the compact graph
+FACES = ["Left", "Down", "Back", "Right", "Top", "Front"]
+FACE_VECTORS = [(-1, 0, 0), (0, -1, 0), (0, 0, -1), (1, 0, 0), (0, 1, 0), (0, 0, 1)]
+
 UP_LEVELS = [
     "TREE_ROOTS",
     "TREE",
@@ -91,7 +101,7 @@ MapScreen = ExtResource( %d )
 HasLesserGate = %s
 '''
 
-GD_HEAD = '''[gd_scene load_steps=150 format=2]
+GD_HEAD = '''[gd_scene load_steps=%d format=2]
 
 [ext_resource path="res://src/Components/Map/MapNode.tscn" type="PackedScene" id=1]
 %s
@@ -100,138 +110,309 @@ GD_HEAD = '''[gd_scene load_steps=150 format=2]
 GD_TEXTURE = '[ext_resource path="res://assets/Other Textures/map_screens/%s.png" type="Texture" id=%d]'
 GD_ROOT = '\n[node name="MapTree" type="Spatial"]\n'
 
-CONN_COUNTER = 0
+class WinConditions(NamedTuple):
+    chests: int
+    locked: int
+    unlocked: int
+    big: int
+    small: int
+    secrets: int
+    others: int
+    scripts: Tuple[str, ...]
 
-def parse_tree(node_xml):
-    global CONN_COUNTER
+    @staticmethod
+    def from_xml(win) -> 'WinConditions':
+        return WinConditions(
+            chests=read_int(win, 'chests'),
+            locked=read_int(win, 'lockedDoors'),
+            unlocked=read_int(win, 'unlockedDoors'),
+            big=read_int(win, 'cubeShards'),
+            small=read_int(win, 'splitUp'),
+            secrets=read_int(win, 'secrets'),
+            others=read_int(win, 'others'),
+            scripts=tuple(s.text for s in win.findall('Scripts/Script')),
+        )
 
-    node = {
-        "name": node_xml.attrib['name'],
-        "lesser": node_xml.attrib['hasLesserGate'].lower(),
-        "warp": node_xml.attrib['hasWarpGate'].lower(),
-        "size": SIZES[node_xml.attrib['type']],
-    }
+    def to_json(self) -> dict:
+        wins = self._asdict()
+        if self.scripts:
+            strs = ', '.join('"{0}"'.format(w) for w in self.scripts)
+            wins['scripts'] = f'PoolStringArray( {strs} )'
+        else:
+            wins['scripts'] = 'null'
+        return wins
 
-    win = node_xml.find('WinConditions')
-    node['_wins'] = {
-        "chests":   int(win.attrib['chests']),
-        "locked":   int(win.attrib['lockedDoors']),
-        "unlocked": int(win.attrib['unlockedDoors']),
-        "big":      int(win.attrib['cubeShards']),
-        "small":    int(win.attrib['splitUp']),
-        "secrets":  int(win.attrib['secrets']),
-        "others":   int(win.attrib['others']),
-    }
 
-    scripts = win.findall('Scripts/Script')
-    if (len(scripts)):
-        words = [s.text for s in scripts]
-        strs = ', '.join('"{0}"'.format(w) for w in words)
-        node['_wins']['scripts'] = f'PoolStringArray( {strs} )'
-    else:
-        node['_wins']['scripts'] = 'null'
+class Connection(NamedTuple):
+    id: int
+    face: str
+    branch: float
+    child: 'MapNode'
 
-    node['_conns'] = []
-    conns = node_xml.findall("Connections/Connection")
-    
-    if (len(conns)):
-        for i, conn in enumerate(conns):
-            next_node = conn.find('Node')
-        
-            node['_conns'] += [{
-                'id': CONN_COUNTER,
-                'face': conn.attrib['face'],
-                'branch': float(conn.attrib['branchOversize']),
-            }]
-            CONN_COUNTER += 1
-            node['_conns'][i]['child'] = parse_tree(next_node)
-   
-    return node
-
-def read_xml(path):
+
+class MapNode(NamedTuple):
+    name: str
+    lesser: bool
+    warp: bool
+    size: float
+    wins: WinConditions
+    connections: Tuple[Connection, ...]
+
+    def to_json(self) -> dict:
+        # Same layout as the old maptree.json, children nested in their connections
+        root = {}
+        stack = [(self, root)]
+        while stack:
+            node, data = stack.pop()
+            data.update({
+                "name": node.name,
+                "lesser": str(node.lesser).lower(),
+                "warp": str(node.warp).lower(),
+                "size": node.size,
+                "_wins": node.wins.to_json(),
+                "_conns": [],
+            })
+            for conn in node.connections:
+                child = {}
+                data['_conns'] += [{
+                    'id': conn.id,
+                    'face': conn.face,
+                    'branch': conn.branch,
+                    'child': child,
+                }]
+                stack += [(conn.child, child)]
+        return root
+
+
+def parse_tree(root_xml) -> MapNode:
+    # Connections are numbered in depth-first order (as the old recursive
+    # parser did), then the immutable nodes are built children first
+    order = [root_xml]
+    ids = {}
+    stack = list(reversed(root_xml.findall("Connections/Connection")))
+    while stack:
+        conn = stack.pop()
+        ids[conn] = len(ids)
+        child = conn.find('Node')
+        order += [child]
+        stack += reversed(child.findall("Connections/Connection"))
+
+    nodes = {}
+    for node_xml in reversed(order):
+        connections = tuple(Connection(
+            id=ids[conn],
+            face=conn.attrib['face'],
+            branch=read_float(conn, 'branchOversize'),
+            child=nodes.pop(conn.find('Node')),
+        ) for conn in node_xml.findall("Connections/Connection"))
+
+        nodes[node_xml] = MapNode(
+            name=node_xml.attrib['name'],
+            lesser=read_bool(node_xml, 'hasLesserGate'),
+            warp=read_bool(node_xml, 'hasWarpGate'),
+            size=SIZES[read_enum(node_xml, 'type', list(SIZES))],
+            wins=WinConditions.from_xml(node_xml.find('WinConditions')),
+            connections=connections,
+        )
+    return nodes[root_xml]
+
+def read_xml(path) -> MapNode:
     with open(path, 'rt') as file:
         print(f'[Info] Reading {path}...', end='')
         root = etree.fromstring(file.read())
     
-    tree = etree.ElementTree(root)
     result = parse_tree(root.find('Node'))
     
     print('Done!')
     return result
 
-GD_NODE = []
-GD_TEX = []
-GD_EXT_COUNT = 1
 
-def generate_scn2(node: dict, path: str, offset: str):
-    global GD_NODE, GD_TEX, GD_EXT_COUNT
+class MapTreeBuilder:
+    """
+    Turns a map tree into the MapTree scene. All state lives in the builder,
+    so several trees can be built side by side in one process.
+    """
 
-    print("[Generate]", f"{node['name']}: {path.lower()}")
-    GD_EXT_COUNT += 1
+    def __init__(self, tree: MapNode) -> None:
+        self.tree = tree
+        self.nodes: List[str] = []
+        self.textures: Dict[str, int] = {}
+        self.ext_count = 1
+
+    @staticmethod
+    def from_xml(path) -> 'MapTreeBuilder':
+        return MapTreeBuilder(read_xml(path))
+
+    def generate(self) -> None:
+        # Depth-first, children in connection order
+        stack = [(self.tree, ".", "0, 0, 0")]
+        while stack:
+            node, path, offset = stack.pop()
+            self.add_node(node, path, offset)
 
-    transform = "1, 0, 0, 0, 1, 0, 0, 0, 1, " + offset
-    
-    # Add MapNode
-    GD_NODE += [MAP_NODE % (
-        # Node information
-        node['name'],
-        path,
-        transform,
-        
-        # Winning conditions
-        node['_wins']['big'],
-        node['_wins']['chests'],
-        node['_wins']['locked'],
-        node['_wins']['others'],
-        node['_wins']['secrets'],
-        node['_wins']['small'],
-        node['_wins']['unlocked'],
-        
-        # Node params
-        1,              # Discovered state
-        node['size'],
-        node['warp'],
-        GD_EXT_COUNT,   # Current MapScreen texture
-        node['lesser'],
-    )]
-
-    # Add MapScreen texture to the header
-    GD_TEX += [GD_TEXTURE % (
-        node['name'].lower(), GD_EXT_COUNT
-    )]
-
-    if (len(node["_conns"])):
-        for conn in node["_conns"]:
             next_path = path.replace('.', '')
-            next_path = os.path.join(next_path, node['name']).replace("\\", "/")
+            next_path = os.path.join(next_path, node.name).replace("\\", "/")
+            stack += [
+                (conn.child, next_path, OFFSETS[conn.face] % (node.size * 4))
+                for conn in reversed(node.connections)
+            ]
+
+    def add_texture(self, name: str) -> int:
+        # Nodes sharing a map screen share its ext_resource
+        screen = name.lower()
+        if screen not in self.textures:
+            self.ext_count += 1
+            self.textures[screen] = self.ext_count
+        return self.textures[screen]
+
+    @property
+    def load_steps(self) -> int:
+        # The scene itself, MapNode.tscn and the map screens
+        return 2 + len(self.textures)
+
+    def add_node(self, node: MapNode, path: str, offset: str) -> None:
+        print("[Generate]", f"{node.name}: {path.lower()}")
+        texture = self.add_texture(node.name)
+
+        transform = "1, 0, 0, 0, 1, 0, 0, 0, 1, " + offset
+        
+        # Add MapNode
+        self.nodes += [MAP_NODE % (
+            # Node information
+            node.name,
+            path,
+            transform,
             
-            next_offset = OFFSETS[conn['face']] % (node['size'] * 4)
+            # Winning conditions
+            node.wins.big,
+            node.wins.chests,
+            node.wins.locked,
+            node.wins.others,
+            node.wins.secrets,
+            node.wins.small,
+            node.wins.unlocked,
             
-            generate_scn2(conn['child'], next_path, next_offset)
+            # Node params
+            1,                  # Discovered state
+            node.size,
+            str(node.warp).lower(),
+            texture,            # Current MapScreen texture
+            str(node.lesser).lower(),
+        )]
+
+    def write(self, path) -> None:
+        with open(path, 'wt') as tscn:
+            textures = [GD_TEXTURE % (screen, id) for screen, id in self.textures.items()]
+            tscn.write(GD_HEAD % (self.load_steps, '\n'.join(textures)))
+            tscn.write(GD_ROOT)
+
+            for node in self.nodes:
+                tscn.write(node)
+
+
+def make_graph(tree: MapNode) -> Dict:
+    """
+    Flattens the tree into the packed arrays of a MapGraph resource. Nodes
+    are listed depth-first like the scene; world positions add up the
+    `OFFSETS` of every connection on the way from the root.
+    """
+    order = []
+    stack = [(tree, (0, 0, 0))]
+    while stack:
+        node, position = stack.pop()
+        order += [(node, position)]
+
+        step = int(node.size * 4)   # %d in OFFSETS
+        stack += [
+            (conn.child, tuple(p + v * step for p, v in zip(position, FACE_VECTORS[FACES.index(conn.face)])))
+            for conn in reversed(node.connections)
+        ]
+    index = {id(node): i for i, (node, _) in enumerate(order)}
+
+    graph = {
+        "names": [], "positions": [], "sizes": [], "flags": array('i'), "conditions": array('i'),
+        "offsets": array('i'), "targets": array('i'), "faces": array('i'), "branches": [],
+    }
+    for node, position in order:
+        wins = node.wins
+        graph["names"] += [node.name]
+        graph["positions"] += position
+        graph["sizes"] += [node.size]
+        graph["flags"].append(int(node.warp) | int(node.lesser) << 1)
+        graph["conditions"].extend([wins.big, wins.chests, wins.locked, wins.others,
+                                    wins.secrets, wins.small, wins.unlocked])
+
+        graph["offsets"].append(len(graph["targets"]))
+        for conn in node.connections:
+            graph["targets"].append(index[id(conn.child)])
+            graph["faces"].append(FACES.index(conn.face))
+            graph["branches"] += [conn.branch]
+    graph["offsets"].append(len(graph["targets"]))
+    return graph
+
 
-def convert_to_tscn(path, data):
-    generate_scn2(data, ".", "0, 0, 0")
+def convert_to_graph(path, tree: MapNode, profiler=Profiler()):
+    with profiler.phase('generate'):
+        graph = make_graph(tree)
+        resource = TscnWriter()
+        script = resource.add_ext_resource("res://src/Components/Map/MapGraph.cs", "Script")
+
+    print(f'''[TRES] Writing {len(graph["names"])} nodes to {path}...''', end=" ")
+    with profiler.phase('write'):
+        resource.write_resource(path, "Resource", {
+            "script": script.reference,
+            "Names": GDObject("PoolStringArray", *graph["names"]),
+            "Positions": GDObject("PoolVector3Array", *graph["positions"]),
+            "Sizes": GDObject("PoolRealArray", *graph["sizes"]),
+            "Flags": PoolIntArray(graph["flags"]),
+            "Conditions": PoolIntArray(graph["conditions"]),
+            "EdgeOffsets": PoolIntArray(graph["offsets"]),
+            "EdgeTargets": PoolIntArray(graph["targets"]),
+            "EdgeFaces": PoolIntArray(graph["faces"]),
+            "EdgeBranches": GDObject("PoolRealArray", *graph["branches"]),
+        })
+
+    print('Done!')
+    return
+
+
+def convert_to_tscn(path, tree: MapNode, profiler=Profiler()):
+    builder = MapTreeBuilder(tree)
+    with profiler.phase('generate'):
+        builder.generate()
     
     print(f'''[TSCN] Writing to {path}...''', end=" ")
-    with open(path, 'wt') as tscn:
-        tscn.write(GD_HEAD % ('\n'.join(GD_TEX)))
-        tscn.write(GD_ROOT)
-
-        for i in range(len(GD_NODE)):
-            tscn.write(GD_NODE[i])
+    with profiler.phase('write'):
+        builder.write(path)
        
     print(f'''Done!''')
     return
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Converts maptree.xml into the map tree scene")
+    parser.add_argument("--compact", action="store_true",
+                        help="write maptree.tres, a MapGraph of packed arrays, "
+                             "instead of maptree2.tscn and maptree.json")
+    add_arguments(parser, 'import_map_tree')
+    args = parser.parse_args()
+    profiler = from_args(args)
+
     abs_path = os.path.dirname(__file__)
     xml_path = os.path.join(abs_path, "maptree.xml")
     tscn_path = os.path.join(abs_path, "maptree2.tscn")
     json_path = os.path.join(abs_path, "maptree.json")
+    tres_path = os.path.join(abs_path, "maptree.tres")
 
-    data = read_xml(xml_path)
-    with open(json_path, 'wt') as json_file:
-        print("[Saving]", "Temp results in maptree.json...")
-        json_file.write(json.dumps(data, indent=4))
+    with profiler.phase('read'):
+        data = read_xml(xml_path)
+
+    if args.compact:
+        convert_to_graph(tres_path, data, profiler)
+    else:
+        with profiler.phase('json'), open(json_path, 'wt') as json_file:
+            print("[Saving]", "Temp results in maptree.json...")
+            json_file.write(json.dumps(data.to_json(), indent=4))
 
-    convert_to_tscn(tscn_path, data)
\ No newline at end of file
+        convert_to_tscn(tscn_path, data, profiler)
+    profiler.report(args.profile, 'import_map_tree', input=xml_path)
\ No newline at end of file
@@ -1,7 +1,8 @@
-import sys
 import json
+import argparse
 import xml.etree.ElementTree as etree
 from pathlib import Path, PurePath
+from profiling import add_arguments, from_args
 
 PO_ID = 'msgid "%s"'
 PO_STR = 'msgstr "%s"'
@@ -75,16 +76,29 @@ def write_pot(path, messages):
             print(file=pot_file)
 
 
+parser = argparse.ArgumentParser(
+    description="Converts the static text XML into gettext catalogs")
+parser.add_argument("path", help="static text XML")
+add_arguments(parser, 'import_text_po')
+args = parser.parse_args()
+profiler = from_args(args)
+
 #orig_path = Path("D:\\Zeffyr\\tools\\statictext.xml").resolve()
-orig_path = Path(sys.argv[1]).resolve()
+orig_path = Path(args.path).resolve()
 json_path = orig_path.with_suffix(".json")
 po_path = orig_path.with_suffix(".%s.po")
 pot_path = orig_path.with_suffix(".pot")
 pos_path = PurePath(orig_path.parent, Path("headers.po"))
 
-parsed = load_xml(orig_path)
-headers = load_headers(pos_path)
+with profiler.phase('read'):
+    parsed = load_xml(orig_path)
+    headers = load_headers(pos_path)
+
+with profiler.phase('json'):
+    write_json(json_path, parsed)
+with profiler.phase('pot'):
+    write_pot(pot_path, parsed['en'])
+with profiler.phase('po'):
+    write_po(po_path, parsed, headers)
 
-write_json(json_path, parsed)
-write_pot(pot_path, parsed['en'])
-write_po(po_path, parsed, headers)
\ No newline at end of file
+profiler.report(args.profile, 'import_text_po', input=str(orig_path))
\ No newline at end of file
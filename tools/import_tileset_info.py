@@ -1,7 +1,16 @@
-import sys
+import argparse
+import multiprocessing as mp
 import xml.etree.ElementTree as etree
 from pathlib import Path
+from collections import Counter
 from dataclasses import dataclass
+from xml_attribs import read_bool, read_enum, read_float
+from profiling import Profiler, add_arguments, from_args
+from batching import BuildManifest, collect_inputs, run_batch
+
+# Part of every manifest entry, bump it when the generated scenes change
+CONVERTER_VERSION = 2
+BUFFER_SIZE = 1 << 20
 
 SCN_HEADER = '[gd_scene load_steps=%d format=2]'
 SCN_MESH = '[ext_resource path="res://assets/Trilesets/%s/%s.mesh" type="ArrayMesh" id=%d]'
@@ -43,6 +52,29 @@ CollisionOnly = %s'''
 
 SUF_TYPES = ["None", "Grass", "Metal", "Stone", "Wood"]
 
+# Collision layer bits of the collision types and actor types, anything else
+# lands on layer 16
+LAYERS = {
+    'Immaterial': 0,
+    'AllSides': 1,
+    'TopOnly': 2,
+    'TopNoStraightLedge': 2,
+    'None': 4,
+    'Ladder': 32,
+    'Vine': 64,
+    'Bouncer': 128,
+}
+DEFAULT_LAYER = 16
+
+# Dev texture (ext_resource id) of the most common collision type
+TEXTURES = {
+    'None': 4,
+    'TopOnly': 2,
+    'TopNoStraightLedge': 2,
+    'AllSides': 3,
+    'Immaterial': 5,
+}
+
 
 @dataclass
 class Trile:
@@ -53,39 +85,64 @@ class Trile:
     actor: str
     size: tuple
     faces: list
-    geometry: bool
+    vertices: int
+    indices: int
 
+    @property
+    def geometry(self) -> bool:
+        return self.vertices > 0
 
-def read_xml(path):
-    print('[XML]', path)
 
-    triles = []
-    tree = etree.parse(path)
-    root = tree.getroot()
+def read_trile(entry, vertices, indices) -> Trile:
+    trile = entry.find('Trile')
 
-    set_name = root.attrib['name'].lower()
+    id = entry.attrib['key']
+    name = trile.attrib['name']
+    surface = read_enum(trile, 'surfaceType', SUF_TYPES)
+    immaterial = read_bool(trile, 'immaterial')
 
-    for entry in root.iter('TrileEntry'):
-        trile = entry.find('Trile')
+    vec3 = trile.find("Size/Vector3")
+    size = (read_float(vec3, 'x'), read_float(vec3, 'y'), read_float(vec3, 'z'))
 
-        id = entry.attrib['key']
-        name = trile.attrib['name']
-        surface = trile.attrib['surfaceType']
-        immaterial = eval(trile.attrib['immaterial'])
+    actor = trile.find("ActorSettings").attrib['type']
 
-        vec3 = trile.find("Size/Vector3")
-        size = (float(vec3.attrib['x']), float(
-            vec3.attrib['y']), float(vec3.attrib['z']))
+    faces = [
+        face.find("CollisionType").text for face in trile.findall("Faces/Face")]
 
-        actor = trile.find("ActorSettings").attrib['type']
-        geometry = len(trile.findall(
-            "Geometry/ShaderInstancedIndexedPrimitives/Vertices/VertexPositionNormalTextureInstance")) > 0
+    return Trile(id, name, immaterial, surface, actor, size, faces, vertices, indices)
 
-        faces = [
-            face.find("CollisionType").text for face in trile.findall("Faces/Face")]
 
-        data = Trile(id, name, immaterial, surface, actor, size, faces, geometry)
-        triles += [data]
+def read_xml(path):
+    print('[XML]', path)
+
+    triles = []
+    set_name = None
+    vertices = indices = 0
+
+    # Streamed: vertices and indices are only counted, and every element is
+    # dropped from the tree once it has been read
+    stack = []
+    for event, elem in etree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if set_name is None:
+                set_name = elem.attrib['name'].lower()
+            stack += [elem]
+            continue
+
+        stack.pop()
+        if elem.tag == 'VertexPositionNormalTextureInstance':
+            vertices += 1
+        elif elem.tag == 'Index':
+            indices += 1
+        elif elem.tag == 'TrileEntry':
+            triles += [read_trile(elem, vertices, indices)]
+            vertices = indices = 0
+        else:
+            continue
+
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
 
     return set_name, triles
 
@@ -95,126 +152,148 @@ def vec2str(vec):
 
 
 def most_common(lst):
-    return max(set(lst), key=lst.count)
-
-
-def find_layer(value):
-    if value == 'Immaterial':
-        return 0
-    elif value == 'AllSides':
-        return 1
-    elif value in ['TopOnly', 'TopNoStraightLedge']:
-        return 2
-    elif value == 'None':
-        return 4
-    elif value == 'Ladder':
-        return 32
-    elif value == 'Vine':
-        return 64
-    elif value == 'Bouncer':
-        return 128
-    else:
-        return 16
-
-
-def select_texture(collision):
-    if collision == 'None':
-        return 4
-    elif collision in ['TopOnly', 'TopNoStraightLedge']:
-        return 2
-    elif collision == 'AllSides':
-        return 3
-    elif collision == 'Immaterial':
-        return 5
-
-
-path = sys.argv[1]
-xml_path = Path(path).resolve()
-tscn_path = xml_path.with_suffix(".tscn")
-
-name, triles = read_xml(xml_path)
-name = name.capitalize()
-
-ext_list = []
-sub_list = []
-node_list = []
-
-ext_count = 5
-sub_count = 0
-node_offset = [0, 0, 0]
-
-node_list += [NODE_ROOT % name]
-ext_list += [SCN_START]
-
-trile: Trile
-for i, trile in enumerate(triles):
-    print('[Trile]', i, '->', trile.name, end=" ")
-
-    _size = vec2str(trile.size)
-    _transform = vec2str(node_offset)
-    _layers = [find_layer(f) for f in trile.faces]
-    _most = most_common(trile.faces)
-    _surface = SUF_TYPES.index(trile.surface)
-
-    if trile.geometry:
-        ext_count += 1
-        ext_list += [SCN_MESH % (name, trile.name, ext_count)]
-
-    if not trile.geometry:
-        sub_count += 1
-        txt = select_texture(_most)
-        sub_list += [SUB_MAT % (sub_count, txt)]
-
-        sub_count += 1
-        sub_list += [SUB_MESH % (sub_count, sub_count - 1, _size)]
-
-    if trile.actor != 'None':
-        actor = find_layer(trile.actor)
-        for i in range(4):
-            _layers[i] += actor
-
-    if (trile.immaterial):
+    # Ties go to the face listed first
+    return Counter(lst).most_common(1)[0][0]
+
+
+def generate_scene(name, triles):
+    ext_list = []
+    sub_list = []
+    node_list = []
+
+    ext_count = 5
+    sub_count = 0
+    cube_meshes = {}
+    node_offset = [0, 0, 0]
+
+    node_list += [NODE_ROOT % name]
+    ext_list += [SCN_START]
+
+    trile: Trile
+    for i, trile in enumerate(triles):
+        print('[Trile]', i, '->', trile.name, end=" ")
+
+        _size = vec2str(trile.size)
+        _transform = vec2str(node_offset)
+        _layers = [LAYERS.get(f, DEFAULT_LAYER) for f in trile.faces]
+        _most = most_common(trile.faces)
+        _surface = SUF_TYPES.index(trile.surface)
+
+        if trile.geometry:
+            ext_count += 1
+            ext_list += [SCN_MESH % (name, trile.name, ext_count)]
+
+        # Collision only triles share one cube per texture and size
+        if not trile.geometry:
+            cube = (TEXTURES.get(_most), _size)
+            if cube not in cube_meshes:
+                sub_count += 1
+                sub_list += [SUB_MAT % (sub_count, cube[0])]
+
+                sub_count += 1
+                sub_list += [SUB_MESH % (sub_count, sub_count - 1, _size)]
+                cube_meshes[cube] = sub_count
+
+        if trile.actor != 'None':
+            actor = LAYERS.get(trile.actor, DEFAULT_LAYER)
+            for i in range(4):
+                _layers[i] += actor
+
+        if (trile.immaterial):
+            for i in range(4):
+                _layers[i] &= 0xFFFF8   # Nuke TopOnly, AllSides, Background
+
+        layer = 0
         for i in range(4):
-            _layers[i] &= 0xFFFF8   # Nuke TopOnly, AllSides, Background
-
-    layer = 0
-    for i in range(4):
-        layer |= _layers[i]
-    print(f"({layer:010b})")
-
-    _mesh = f"SubResource( {sub_count} )" if not trile.geometry else f"ExtResource( {ext_count} )"
-    _col = str(not trile.geometry).lower()
-
-    node = NODE_TRILE % (
-        trile.name,
-        _transform,
-        _mesh,
-        _layers[0],
-        _layers[1],
-        _layers[2],
-        _layers[3],
-        _surface,
-        _size,
-        _col
-    )
-
-    node_list += [node]
-    node_offset[0] += 2.0
-    if (node_offset[0] > 18.0):
-        node_offset[0] = 0.0
-        node_offset[2] -= 2.0
-
-header = SCN_HEADER % (ext_count + sub_count)
-with open(tscn_path, mode='wt', encoding='utf-8') as tscn:
-    print('[TSCN]', tscn_path)
-    
-    exts = '\n'.join(ext_list)
-    subs = '\n'.join(sub_list)
-    nodes = '\n'.join(node_list)
-
-    print(header, file=tscn)
-    print(file=tscn)
-    print(exts, file=tscn)
-    print(file=tscn)
-    print(subs, file=tscn)
-    print(nodes, file=tscn)
+            layer |= _layers[i]
+        print(f"({layer:010b})")
+
+        _mesh = f"SubResource( {cube_meshes[cube]} )" if not trile.geometry else f"ExtResource( {ext_count} )"
+        _col = str(not trile.geometry).lower()
+
+        node = NODE_TRILE % (
+            trile.name,
+            _transform,
+            _mesh,
+            _layers[0],
+            _layers[1],
+            _layers[2],
+            _layers[3],
+            _surface,
+            _size,
+            _col
+        )
+
+        node_list += [node]
+        node_offset[0] += 2.0
+        if (node_offset[0] > 18.0):
+            node_offset[0] = 0.0
+            node_offset[2] -= 2.0
+
+    header = SCN_HEADER % (ext_count + sub_count)
+    return header, ext_list, sub_list, node_list
+
+
+def write_scene(tscn_path, header, ext_list, sub_list, node_list):
+    # One buffered write of the whole scene
+    with open(tscn_path, mode='wt', encoding='utf-8', buffering=BUFFER_SIZE) as tscn:
+        print('[TSCN]', tscn_path)
+        tscn.write(header + '\n\n')
+        tscn.write('\n'.join(ext_list) + '\n\n')
+        tscn.write('\n'.join(sub_list) + '\n')
+        tscn.write('\n'.join(node_list) + '\n')
+
+
+def convert_tileset(xml_path: Path, profiler: Profiler) -> Path:
+    tscn_path = xml_path.with_suffix(".tscn")
+
+    with profiler.phase('read'):
+        name, triles = read_xml(xml_path)
+    name = name.capitalize()
+
+    with profiler.phase('generate'):
+        scene = generate_scene(name, triles)
+
+    with profiler.phase('write'):
+        write_scene(tscn_path, *scene)
+    return tscn_path
+
+
+if __name__ == '__main__':
+    mp.freeze_support()
+
+    parser = argparse.ArgumentParser(
+        description="Generates tileset preview scenes from trileset XMLs")
+    parser.add_argument("paths", nargs='+',
+                        help="trileset XML, or directories / glob patterns for a batch run")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes in batch runs (default: all cores)")
+    parser.add_argument("--manifest", default=None,
+                        help="build manifest for incremental batch runs "
+                             "(default: import_tileset_info.json next to the first XML)")
+    parser.add_argument("--force", action="store_true",
+                        help="regenerate every tileset, even if it is up to date")
+    add_arguments(parser, 'import_tileset_info')
+    args = parser.parse_args()
+
+    paths = collect_inputs(args.paths)
+    if not paths:
+        print("No trileset XMLs found ...")
+        exit(-1)
+
+    # A single XML keeps the old verbose behaviour
+    if len(args.paths) == 1 and Path(args.paths[0]).is_file():
+        profiler = from_args(args)
+        convert_tileset(paths[0], profiler)
+        profiler.report(args.profile, 'import_tileset_info', input=str(paths[0]))
+        exit(0)
+
+    manifest_path = Path(args.manifest or paths[0].with_name("import_tileset_info.json"))
+    manifest = BuildManifest(manifest_path.resolve(), CONVERTER_VERSION)
+    if args.force:
+        for path in paths:
+            manifest.update(path, None)
+
+    # The per-trile log only matters for single runs
+    exit(run_batch(paths, convert_tileset, 'import_tileset_info', 'tilesets', 'Tileset',
+                   args.jobs, manifest, args.profile, args.cprofile, quiet=True))
@@ -0,0 +1,87 @@
+import json
+import time
+import cProfile
+import tracemalloc
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Per-phase timing for the converters in tools/, enabled with --profile.
+#
+# Every phase records its wall time and the peak of Python allocations
+# (tracemalloc) while it ran. Phases entered several times (e.g. once per
+# character) are accumulated. The report is written as JSON, optionally with
+# a cProfile dump of the profiled phases next to it. Tracing allocations
+# slows the run down, so only compare timings between profiled runs.
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False, cprofile: bool = False) -> None:
+        self.enabled = enabled
+        self.phases: Dict[str, Dict] = {}
+        self.cprofile = cProfile.Profile() if enabled and cprofile else None
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        if self.cprofile:
+            self.cprofile.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.cprofile:
+                self.cprofile.disable()
+            _, peak = tracemalloc.get_traced_memory()
+
+            phase = self.phases.setdefault(name, {
+                'seconds': 0.0, 'peak_mb': 0.0, 'calls': 0
+            })
+            phase['seconds'] = round(phase['seconds'] + elapsed, 4)
+            phase['peak_mb'] = max(phase['peak_mb'], round(peak / 2**20, 2))
+            phase['calls'] += 1
+
+    def summary(self) -> Dict:
+        return {
+            'total_seconds': round(time.perf_counter() - self.start, 4),
+            'phases': self.phases,
+        }
+
+    def dump_stats(self, path: Path) -> None:
+        if self.cprofile:
+            self.cprofile.dump_stats(str(path))
+
+    def report(self, path: Optional[str], tool: str, **extra) -> None:
+        if not self.enabled:
+            return
+        write_report(path, tool, **extra, **self.summary())
+        self.dump_stats(Path(path).with_suffix('.prof'))
+
+
+def write_report(path: str, tool: str, **data) -> None:
+    report = {'tool': tool, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), **data}
+    with open(path, 'wt') as file:
+        json.dump(report, file, indent=4)
+    print('[Profile]', path)
+
+
+def add_arguments(parser, tool: str) -> None:
+    parser.add_argument("--profile", nargs='?', metavar="REPORT",
+                        const=f"{tool}.profile.json", default=None,
+                        help=f"write per-phase timings to a JSON report "
+                             f"(default: {tool}.profile.json)")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="with --profile, also dump cProfile stats next to the report")
+
+
+def from_args(args) -> Profiler:
+    return Profiler(args.profile is not None, args.cprofile)
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from xna_geometry import GeometryCache, load_geometry
+
+ART_XML = """<ArtObject name="Bench"><ShaderInstancedIndexedPrimitives type="TriangleList"><Vertices>
+<VertexPositionNormalTextureInstance><Position><Vector3 x="0" y="1" z="2" /></Position><Normal>4</Normal><TextureCoord><Vector2 x="0.1" y="0.2" /></TextureCoord></VertexPositionNormalTextureInstance>
+<VertexPositionNormalTextureInstance><Position><Vector3 x="1" y="1" z="2" /></Position><Normal><Vector3 x="0" y="0" z="1" /></Normal><TextureCoord><Vector2 x="0.5" y="0.2" /></TextureCoord></VertexPositionNormalTextureInstance>
+<VertexPositionNormalTextureInstance><Position><Vector3 x="1" y="0" z="2" /></Position><Normal>5</Normal><TextureCoord><Vector2 x="0.5" y="0.7" /></TextureCoord></VertexPositionNormalTextureInstance>
+</Vertices><Indices><Index>0</Index><Index>1</Index><Index>2</Index></Indices></ShaderInstancedIndexedPrimitives></ArtObject>"""
+
+
+class SidecarTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.xml = Path(self.dir.name, 'bench.xml')
+        self.xml.write_text(ART_XML)
+        self.sidecar = GeometryCache.sidecar_path(self.xml)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_truncated_sidecar_is_rebuilt(self):
+        expected = load_geometry(self.xml)
+        self.assertTrue(self.sidecar.exists())
+
+        data = self.sidecar.read_bytes()
+        self.sidecar.write_bytes(data[:len(data) // 2])
+        self.assertIsNone(GeometryCache.read_sidecar(self.xml))
+
+        cache = load_geometry(self.xml)
+        np.testing.assert_array_equal(cache.vertices, expected.vertices)
+        np.testing.assert_array_equal(cache.faces, expected.faces)
+        self.assertIsNotNone(GeometryCache.read_sidecar(self.xml))
+
+    def test_sidecar_without_arrays_is_rebuilt(self):
+        load_geometry(self.xml)
+        with open(self.sidecar, 'wb') as file:
+            np.savez(file, version=np.array(1))
+        self.assertIsNone(GeometryCache.read_sidecar(self.xml))
+        self.assertEqual(load_geometry(self.xml).names, ['Bench'])
+
+    def test_no_temp_files_left(self):
+        load_geometry(self.xml)
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['bench.geometry.npz', 'bench.xml'])
+
+
+if __name__ == '__main__':
+    unittest.main()
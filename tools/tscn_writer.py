@@ -0,0 +1,208 @@
+import json
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Writes Godot 3 text scenes (.tscn) and resources (.tres) straight to a
+# buffered file.
+#
+# The output is the same text godot_parser's GDScene.write produces for the
+# scenes our importers generate, but without building its section and node
+# trees first: resources are kept as plain records and nodes are streamed
+# out depth-first while walking the tree.
+
+BUFFER_SIZE = 1 << 20
+ARRAY_CHUNK = 1 << 16
+
+
+class Reference:
+    __slots__ = ('kind', 'id')
+
+    def __init__(self, kind: str, id: int) -> None:
+        self.kind = kind
+        self.id = id
+
+    def __str__(self) -> str:
+        return f"{self.kind}( {self.id} )"
+
+
+class Resource:
+    __slots__ = ('name', 'header', 'properties', 'reference')
+
+    def __init__(self, name: str, kind: str, id: int, header: Dict[str, Any]) -> None:
+        self.name = name
+        self.header = header
+        self.properties: Dict[str, Any] = {}
+        self.reference = Reference(kind, id)
+
+    @property
+    def id(self) -> int:
+        return self.reference.id
+
+
+class PoolIntArray:
+    """PoolIntArray value backed by an array, serialized in large chunks."""
+    __slots__ = ('values',)
+
+    def __init__(self, values: array) -> None:
+        self.values = values
+
+    def write(self, file) -> None:
+        file.write("PoolIntArray( ")
+        for i in range(0, len(self.values), ARRAY_CHUNK):
+            if i:
+                file.write(", ")
+            file.write(", ".join(map(str, self.values[i:i + ARRAY_CHUNK])))
+        file.write(" )")
+
+
+class PoolByteArray:
+    """PoolByteArray value backed by bytes, serialized in large chunks."""
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    def write(self, file) -> None:
+        file.write("PoolByteArray( ")
+        for i in range(0, len(self.data), ARRAY_CHUNK):
+            if i:
+                file.write(", ")
+            file.write(", ".join(map(str, self.data[i:i + ARRAY_CHUNK])))
+        file.write(" )")
+
+
+class SceneNode:
+    __slots__ = ('name', 'type', 'instance', 'properties', 'children')
+
+    def __init__(self, name: str, type: Optional[str] = None,
+                 instance: Any = None, properties: Optional[Dict] = None) -> None:
+        self.name = name
+        self.type = type
+        self.instance = instance
+        self.properties = properties if properties is not None else {}
+        self.children: List['SceneNode'] = []
+
+    def add_child(self, node: 'SceneNode') -> None:
+        self.children += [node]
+
+
+class TscnWriter:
+    def __init__(self) -> None:
+        self.ext_resources: List[Resource] = []
+        self.sub_resources: List[Resource] = []
+
+    def add_ext_resource(self, path: str, type: str) -> Resource:
+        id = len(self.ext_resources) + 1
+        resource = Resource("ext_resource", "ExtResource", id, {
+            "path": path, "type": type, "id": id
+        })
+        self.ext_resources += [resource]
+        return resource
+
+    def add_sub_resource(self, type: str, **properties) -> Resource:
+        id = len(self.sub_resources) + 1
+        resource = Resource("sub_resource", "SubResource", id, {
+            "type": type, "id": id
+        })
+        resource.properties.update(properties)
+        self.sub_resources += [resource]
+        return resource
+
+    @property
+    def load_steps(self) -> int:
+        return 1 + len(self.ext_resources) + len(self.sub_resources)
+
+    def write(self, path, root: SceneNode) -> None:
+        with open(path, 'wt', encoding='utf-8', buffering=BUFFER_SIZE) as file:
+            file.write(f"[gd_scene load_steps={self.load_steps} format=2]")
+
+            for resource in self.ext_resources + self.sub_resources:
+                file.write("\n\n")
+                write_section(file, resource.name,
+                              resource.header, resource.properties)
+
+            for node, parent in walk(root):
+                header = {"name": node.name}
+                if node.type is not None and node.instance is None:
+                    header["type"] = node.type
+                if parent is not None:
+                    header["parent"] = parent
+                if node.instance is not None:
+                    header["instance"] = Reference("ExtResource", node.instance)
+
+                file.write("\n\n")
+                write_section(file, "node", header, node.properties)
+
+            file.write("\n")
+
+    def write_resource(self, path, type: str, properties: Dict[str, Any]) -> None:
+        with open(path, 'wt', encoding='utf-8', buffering=BUFFER_SIZE) as file:
+            file.write(f"[gd_resource type={stringify(type)} load_steps={self.load_steps} format=2]")
+
+            for resource in self.ext_resources + self.sub_resources:
+                file.write("\n\n")
+                write_section(file, resource.name,
+                              resource.header, resource.properties)
+
+            file.write("\n\n[resource]")
+            for key, value in properties.items():
+                file.write(f"\n{key} = ")
+                write_value(file, value)
+            file.write("\n")
+
+
+def walk(root: SceneNode) -> Iterator[Tuple[SceneNode, Optional[str]]]:
+    # Depth-first in child order, yielding each node with its parent path
+    stack = [(root, None)]
+    while stack:
+        node, parent = stack.pop()
+        yield node, parent
+
+        if parent is None:
+            path = "."
+        elif parent == ".":
+            path = node.name
+        else:
+            path = parent + "/" + node.name
+        stack += [(child, path) for child in reversed(node.children)]
+
+
+def write_section(file, name: str, header: Dict[str, Any], properties: Dict[str, Any]) -> None:
+    attributes = " ".join(f"{k}={stringify(v)}" for k, v in header.items())
+    file.write(f"[{name} {attributes}]")
+
+    for key, value in properties.items():
+        file.write(f"\n{key} = ")
+        write_value(file, value)
+
+
+def write_value(file, value: Any) -> None:
+    if isinstance(value, (PoolIntArray, PoolByteArray)):
+        value.write(file)
+    elif isinstance(value, dict):
+        file.write("{\n")
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                file.write(",\n")
+            file.write(f'"{key}": ')
+            write_value(file, item)
+        file.write("\n}")
+    elif isinstance(value, list):
+        file.write("[ ")
+        for i, item in enumerate(value):
+            if i:
+                file.write(", ")
+            write_value(file, item)
+        file.write(" ]")
+    else:
+        file.write(stringify(value))
+
+
+def stringify(value: Any) -> str:
+    if value is None:
+        return "null"
+    elif isinstance(value, str):
+        return json.dumps(value)
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
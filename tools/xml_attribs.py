@@ -0,0 +1,69 @@
+from functools import lru_cache
+from typing import Sequence
+
+# Typed readers for XML attributes of the exported FEZ assets.
+#
+# Attribute values repeat a lot ("True", "False", "0", "1", ...), so every
+# text -> value conversion is cached. Malformed or missing values raise
+# XmlValueError naming the element and attribute instead of failing (or
+# worse, running) somewhere inside eval().
+
+BOOLS = {'true': True, 'false': False}
+
+
+class XmlValueError(ValueError):
+    pass
+
+
+def read_str(xml, name: str) -> str:
+    try:
+        return xml.attrib[name]
+    except KeyError:
+        raise XmlValueError(f"<{xml.tag}> has no '{name}' attribute") from None
+
+
+def read_bool(xml, name: str) -> bool:
+    return convert(xml, name, to_bool, "a bool")
+
+
+def read_int(xml, name: str) -> int:
+    return convert(xml, name, to_int, "an int")
+
+
+def read_float(xml, name: str) -> float:
+    return convert(xml, name, to_float, "a float")
+
+
+def read_enum(xml, name: str, values: Sequence[str]) -> str:
+    text = read_str(xml, name)
+    if text not in values:
+        raise XmlValueError(
+            f"<{xml.tag}> attribute '{name}': expected one of {', '.join(values)}, got {text!r}")
+    return text
+
+
+def convert(xml, name: str, converter, expected: str):
+    text = read_str(xml, name)
+    try:
+        return converter(text)
+    except ValueError:
+        raise XmlValueError(
+            f"<{xml.tag}> attribute '{name}': expected {expected}, got {text!r}") from None
+
+
+@lru_cache(maxsize=None)
+def to_bool(text: str) -> bool:
+    value = BOOLS.get(text.strip().lower())
+    if value is None:
+        raise ValueError(text)
+    return value
+
+
+@lru_cache(maxsize=4096)
+def to_int(text: str) -> int:
+    return int(text)
+
+
+@lru_cache(maxsize=4096)
+def to_float(text: str) -> float:
+    return float(text)
@@ -0,0 +1,264 @@
+import os
+import math
+import numpy as np
+import xml.etree.ElementTree as etree
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+from xml_attribs import XmlValueError, read_str, to_int
+
+# Geometry of the XNA-exported triles and art objects, read into flat
+# NumPy arrays instead of one tuple per vertex.
+#
+# FEZ is Y-up while Blender (and our glTF exports) are Z-up, so positions
+# get the fixed +90° rotation around X that the Blender importers used to
+# apply vertex by vertex with mathutils.
+#
+# GeometryCache keeps every geometry of one XML (a trile set or an art
+# object) in a .geometry.npz sidecar, so the Blender scripts can skip the
+# XML on reruns. Sidecars can be built ahead of time, in parallel and
+# without Blender, with cache_geometry.py.
+
+VERTICES = "ShaderInstancedIndexedPrimitives/Vertices/VertexPositionNormalTextureInstance"
+INDICES = "ShaderInstancedIndexedPrimitives/Indices/Index"
+
+# Normals are exported either as a Vector3 or as the FaceOrientation byte
+# (Left, Down, Back, Right, Up, Front) of the face they belong to
+FACE_NORMALS = [
+    (-1.0, 0.0, 0.0), (0.0, -1.0, 0.0), (0.0, 0.0, -1.0),
+    (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0),
+]
+
+CACHE_VERSION = 1
+
+_ANGLE = math.radians(90.0)
+ROTATION = np.array([
+    [1.0, 0.0, 0.0],
+    [0.0, math.cos(_ANGLE), -math.sin(_ANGLE)],
+    [0.0, math.sin(_ANGLE), math.cos(_ANGLE)],
+])
+
+
+@dataclass
+class Geometry:
+    vertices: np.ndarray    # (n, 3) float32, rotated to Z-up
+    texcoords: np.ndarray   # (n, 2) float32, as exported (V not flipped)
+    faces: np.ndarray       # (m, 3) uint32 (or smaller once welded), in reversed face order
+    normals: np.ndarray     # (n, 3) float32, rotated to Z-up
+
+    def __bool__(self) -> bool:
+        return len(self.vertices) > 0 or len(self.faces) > 0
+
+
+def read_geometry(xml) -> Geometry:
+    """
+    Reads the vertices and indices under `xml`, the parent element of
+    ShaderInstancedIndexedPrimitives (a trile's Geometry or an art object).
+    """
+    positions, texcoords, normals = [], [], []
+
+    if xml is not None:
+        for vertex in xml.iterfind(VERTICES):
+            pos = vertex.find("Position/Vector3").attrib
+            uv = vertex.find("TextureCoord/Vector2").attrib
+            positions += (pos["x"], pos["y"], pos["z"])
+            texcoords += (uv["x"], uv["y"])
+            normals += read_normal(vertex.find("Normal"))
+        indices = [index.text for index in xml.iterfind(INDICES)]
+    else:
+        indices = []
+
+    vertices = np.array(positions, dtype=np.float64).reshape(-1, 3)
+    vertices = (vertices @ ROTATION.T).astype(np.float32)
+
+    normals = np.array(normals, dtype=np.float64).reshape(-1, 3)
+    normals = (normals @ ROTATION.T).astype(np.float32)
+
+    texcoords = np.array(texcoords, dtype=np.float32).reshape(-1, 2)
+
+    faces = np.array(indices, dtype=np.uint32)
+    faces = faces[:len(faces) - len(faces) % 3].reshape(-1, 3)[::-1]
+
+    return Geometry(vertices, texcoords, np.ascontiguousarray(faces), normals)
+
+
+def read_normal(xml) -> Tuple:
+    if xml is None:
+        return (0.0, 0.0, 0.0)
+    vector = xml.find("Vector3")
+    if vector is not None:
+        return (read_str(vector, "x"), read_str(vector, "y"), read_str(vector, "z"))
+    try:
+        face = to_int((xml.text or '').strip())
+    except ValueError:
+        face = -1
+    if not 0 <= face < len(FACE_NORMALS):
+        raise XmlValueError(
+            f"<{xml.tag}>: expected a Vector3 or a face orientation 0-5, got {xml.text!r}")
+    return FACE_NORMALS[face]
+
+
+def weld(geometry: Geometry, normals: bool = False) -> Geometry:
+    """
+    Merges the vertices that share a position and UV (and normal, when the
+    output keeps normals), keeping them in order of first use. Faces are
+    remapped to the smallest unsigned type that holds the new vertex count.
+    """
+    if not len(geometry.vertices):
+        return geometry
+
+    columns = [geometry.vertices, geometry.texcoords] + ([geometry.normals] if normals else [])
+    keys = np.ascontiguousarray(np.hstack(columns), dtype=np.float32)
+    rows = keys.view(np.dtype((np.void, keys.itemsize * keys.shape[1]))).ravel()
+
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+
+    keep = first[order]
+    faces = remap[inverse.ravel()][geometry.faces].astype(index_dtype(len(keep)))
+    return Geometry(geometry.vertices[keep], geometry.texcoords[keep],
+                    faces, geometry.normals[keep])
+
+
+def index_dtype(count: int):
+    # The largest value of each type is left out, glTF reserves it for
+    # primitive restart
+    if count < 0xFF:
+        return np.uint8
+    if count < 0xFFFF:
+        return np.uint16
+    return np.uint32
+
+
+class GeometryCache:
+    """
+    All geometries of one XML, concatenated into a few flat arrays. Entry `i`
+    owns vertices [vertex_offsets[i], vertex_offsets[i+1]) and likewise for
+    faces; indices are local to the entry. Art objects have a single entry.
+    """
+
+    def __init__(self, name: str, keys: List[str], names: List[str],
+                 geometries: List[Geometry]) -> None:
+        self.name = name
+        self.keys = keys
+        self.names = names
+        self.vertex_offsets = np.cumsum([0] + [len(g.vertices) for g in geometries])
+        self.face_offsets = np.cumsum([0] + [len(g.faces) for g in geometries])
+        self.vertices = concat([g.vertices for g in geometries], (0, 3), np.float32)
+        self.normals = concat([g.normals for g in geometries], (0, 3), np.float32)
+        self.texcoords = concat([g.texcoords for g in geometries], (0, 2), np.float32)
+        self.faces = concat([g.faces for g in geometries], (0, 3), np.uint32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __getitem__(self, i: int) -> Geometry:
+        # Views into the flat arrays, nothing is copied
+        v = slice(self.vertex_offsets[i], self.vertex_offsets[i + 1])
+        f = slice(self.face_offsets[i], self.face_offsets[i + 1])
+        return Geometry(self.vertices[v], self.texcoords[v], self.faces[f], self.normals[v])
+
+    @staticmethod
+    def from_xml(path: Path) -> 'GeometryCache':
+        keys, names, geometries = [], [], []
+        root = None
+
+        # Trile sets are streamed entry by entry, art objects are one geometry
+        for event, elem in etree.iterparse(str(path), events=('start', 'end')):
+            if root is None:
+                root = elem
+            elif event == 'end' and elem.tag == 'TrileEntry':
+                trile = elem.find("Trile")
+                keys += [elem.attrib['key']]
+                names += [trile.attrib['name']]
+                geometries += [read_geometry(trile.find("Geometry"))]
+                elem.clear()
+
+        # Anything that is neither is rejected rather than read as an empty art
+        if root.tag != 'TrileSet' and not keys:
+            if root.find("ShaderInstancedIndexedPrimitives") is None:
+                raise XmlValueError(
+                    f"{path}: <{root.tag}> is neither a trile set nor an art object")
+            keys, names, geometries = [''], [read_str(root, 'name')], [read_geometry(root)]
+        return GeometryCache(read_str(root, 'name'), keys, names, geometries)
+
+    @staticmethod
+    def sidecar_path(path: Path) -> Path:
+        return path.with_suffix('.geometry.npz')
+
+    @staticmethod
+    def sidecar_is_current(path: Path) -> bool:
+        # Only reads the header arrays of the sidecar
+        try:
+            with np.load(GeometryCache.sidecar_path(path), allow_pickle=False) as data:
+                return (data['version'] == CACHE_VERSION and
+                        data['mtime'] == path.stat().st_mtime_ns)
+        except Exception:
+            return False
+
+    @staticmethod
+    def read_sidecar(path: Path) -> Optional['GeometryCache']:
+        # A truncated, foreign or outdated sidecar is just a stale cache
+        # (BadZipFile, KeyError, EOFError, ...), the XML gets parsed again
+        try:
+            with np.load(GeometryCache.sidecar_path(path), allow_pickle=False) as data:
+                if (data['version'] != CACHE_VERSION or
+                        data['mtime'] != path.stat().st_mtime_ns):
+                    return None
+
+                cache = GeometryCache.__new__(GeometryCache)
+                cache.name = str(data['name'])
+                cache.keys = data['keys'].tolist()
+                cache.names = data['names'].tolist()
+                for array in ('vertex_offsets', 'face_offsets', 'vertices',
+                              'normals', 'texcoords', 'faces'):
+                    setattr(cache, array, data[array])
+        except Exception:
+            return None
+        return cache
+
+    def write_sidecar(self, path: Path) -> None:
+        # Writers of the same XML (duplicate inputs, concurrent tools) each
+        # use their own temp file, os.replace publishes whole sidecars only
+        sidecar = GeometryCache.sidecar_path(path)
+        temp = sidecar.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            with open(temp, 'wb') as file:
+                np.savez(file,
+                         version=CACHE_VERSION,
+                         mtime=path.stat().st_mtime_ns,
+                         name=np.array(self.name),
+                         keys=np.array(self.keys, dtype=str),
+                         names=np.array(self.names, dtype=str),
+                         vertex_offsets=self.vertex_offsets,
+                         face_offsets=self.face_offsets,
+                         vertices=self.vertices,
+                         normals=self.normals,
+                         texcoords=self.texcoords,
+                         faces=self.faces)
+            os.replace(temp, sidecar)
+        except OSError as e:
+            print(f"[Warning] Can't write the geometry cache: {e}")
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+
+
+def load_geometry(path, rebuild: bool = False) -> GeometryCache:
+    """
+    Geometry of the trile set or art object XML at `path`, read from its
+    .geometry.npz sidecar when that is current, else parsed and cached.
+    """
+    path = Path(path)
+    cache = None if rebuild else GeometryCache.read_sidecar(path)
+    if cache is None:
+        cache = GeometryCache.from_xml(path)
+        cache.write_sidecar(path)
+    return cache
+
+
+def concat(arrays: List[np.ndarray], empty: Tuple, dtype) -> np.ndarray:
+    return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.empty(empty, dtype)